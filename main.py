@@ -15,8 +15,9 @@ if __name__ == '__main__':
 
     # EEG Parser
     eeg_parser = subparsers.add_parser('eeg', help='Analysis for EEG data')
-    eeg_parser.add_argument("Configuration_type", help="The run configuration used for analysis: sr | ss | cs")
-    eeg_parser.add_argument("Model", help="The language model code to compute surprisal values")
+    eeg_parser.add_argument("Configuration_type", help="The run configuration used for analysis: sr | ss | cs | mm")
+    eeg_parser.add_argument("Model", help="The language model code to compute surprisal values, a comma "
+                                          "separated list of codes for the mm configuration")
     eeg_parser.add_argument("Context_length", type=int, help="The number of preceding words to consider when computing surprisal")
     eeg_parser.add_argument("Text_path", help="File path to the text data")
     eeg_parser.add_argument("Channel_path", help="Filepeath to channel name file")
@@ -64,6 +65,10 @@ if __name__ == '__main__':
             erc.cross_subject(model_type, context, text_filepath, channel_name_path, eeg_path,
                               event_path, event_type, montage, output_file)
 
+        elif (run_type == 'mm'):
+            erc.multi_model_run(model_type.split(','), context, text_filepath, channel_name_path, eeg_path,
+                                event_path, event_type, montage, output_file)
+
         else:
             print('Run configuration is not valid')
             sys.exit()
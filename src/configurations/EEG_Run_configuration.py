@@ -59,6 +59,64 @@ def single_run(model_type, context, text_filepath,channel_name_path,eeg_path, ev
     _ = ev.plot_rERP(Evoked, output_file)
 
 
+def multi_model_run(model_types, context, text_filepath, channel_name_path, eeg_path, event_path, event_type, montage,
+                    output_file):
+    """ This is the configuration function for anlysing EEG data for a single recording with several language models
+        Parameters
+        ----------
+        model_types : list
+            the language model codes to compute the word surprisal with
+
+        context: int
+            the number of word to consider in the calculation of the probability of a next word
+
+        text_filepath: basestring
+            filepath to the file that contains the words whose surprisal values will be calculated
+
+        channel_name_path: basestring
+            filepath to file that contains the names of the channels in the head scalp montage
+
+        eeg_path: basestring
+            filepath to the file that contains the raw EEG data
+
+        event_path: basestring
+            filepath to the file that contains the event type and time
+
+        event_type: basestring
+            denotes what event type tp use in the analysis
+
+        montage: basestring
+            the head scalp layout used to record the eeg data
+
+        output_file: basestring
+            filepath to the output folder that the output of the anlaysis will be saved to
+
+        Notes
+        -----
+        The words are read and cleaned, and the EEG preprocessed, once for all the models. The
+        regression is run for each model with its own surprisal columns and the plots of each
+        model are saved to a folder named after the model inside output_file, eg output_file/gpt2/
+        """
+    event_id = {event_type: 1}
+
+    # calculate word Surprisal for every model in one covariate table
+    word_list = util.read_flaten_word_list(text_filepath)
+    covariates = eec.calculate_covariates(model_types, word_list, context)
+    # preprocess of eeg data
+    raw, events = eec.preprocessed_eeg_raw(channel_name_path, eeg_path, montage, event_path, event_type)
+
+    # Time Resolved Regression for each model
+    for model_type in model_types:
+        model_columns = [column for column in covariates.columns if column.endswith('_' + model_type)]
+        coefficients, regression_data = eec.time_resolved_regression(raw, events, event_id, covariates[model_columns])
+        Evoked = trr._make_evokeds(coefficients, regression_data.conds, regression_data.cond_length,
+                                   regression_data.tmin_s, regression_data.tmax_s, regression_data.info)
+        # plot_rERP prefixes the file names with the path, so it ends with a separator
+        model_output = os.path.join(output_file, model_type, '')
+        os.makedirs(model_output, exist_ok=True)
+        _ = ev.plot_rERP(Evoked, model_output)
+
+
 def single_subject(model_type, context, text_filepath, channel_name_path, eeg_path, event_path, event_type, montage, output_file):
     """ This is the configuration function for anlysing EEG data for all the runs of a single subject
         Parameters
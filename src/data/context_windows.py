@@ -0,0 +1,144 @@
+import numpy as np
+
+
+class tokenWindow(np.ndarray):
+    """A read-only view of part of a token array whose elements are returned as Python scalars,
+    so a window indexes and iterates like the list it replaces"""
+
+    def __getitem__(self, index):
+        item = super().__getitem__(index)
+        if isinstance(item, np.generic):
+            return item.item()
+
+        return item
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+
+class contextWindows:
+
+    def __init__(self, tokens, starts, ends):
+        """Context windows held as start and end positions into one contiguous token array
+
+        Parameters
+        ----------
+        tokens : ndarray
+            the tokens of the text, made read-only and shared by every window
+
+        starts: ndarray
+            the position of the first token of each window
+
+        ends: ndarray
+            the position after the last token of each window
+
+        Notes
+        -----
+        A window is a slice of tokens, so indexing returns a view and no token is copied until
+        a batch of windows is padded for the model
+
+        .. versionadded:: 0.0.0
+        """
+        tokens = np.asarray(tokens)
+        if tokens.flags.writeable:
+            tokens = tokens.view()
+            tokens.flags.writeable = False
+
+        self.tokens = tokens
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+
+    @property
+    def lengths(self):
+        """The number of tokens in each window"""
+
+        return self.ends - self.starts
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self.tokens[self.starts[index]:self.ends[index]].view(tokenWindow)
+
+        # a slice or a list of indices selects windows sharing the same tokens
+        return contextWindows(self.tokens, self.starts[index], self.ends[index])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __eq__(self, other):
+        return self.tolist() == [list(window) for window in other]
+
+    def tolist(self):
+        """Returns the windows as a list of lists"""
+
+        return [self.tokens[start:end].tolist() for start, end in zip(self.starts, self.ends)]
+
+    def padded(self, padding=0):
+        """Copies the windows into the rows of an array right padded to the longest window
+
+        Parameters
+        ----------
+        padding: optional
+            the value of the positions after the end of a window
+
+        Returns
+        -------
+        windows: ndarray
+            one row per window
+
+        mask: ndarray
+            True over the tokens of each window and False over the padding
+
+        .. versionadded:: 0.0.0
+        """
+        width = int(self.lengths.max()) if len(self) else 0
+        positions = np.arange(width)
+        mask = positions < self.lengths[:, None]
+        index = np.minimum(self.starts[:, None] + positions, max(len(self.tokens) - 1, 0))
+        windows = np.where(mask, self.tokens[index], padding) if len(self.tokens) else np.full(mask.shape, padding)
+
+        return windows, mask
+
+    @staticmethod
+    def concatenate(windows):
+        """Joins several contextWindows into one, copying their tokens into a single array
+
+        .. versionadded:: 0.0.0
+        """
+        offsets = np.cumsum([0] + [len(window.tokens) for window in windows])
+        tokens = np.concatenate([window.tokens for window in windows]) if windows else np.zeros(0, dtype=np.int64)
+        starts = np.concatenate([[]] + [window.starts + offset for window, offset in zip(windows, offsets)])
+        ends = np.concatenate([[]] + [window.ends + offset for window, offset in zip(windows, offsets)])
+
+        return contextWindows(tokens, starts, ends)
+
+
+def sliding_windows(items, context_length):
+    """Creates the windows of the items before each position as used by text_to_sequences
+
+    Parameters
+    ----------
+    items: list
+        the tokens or words of the text
+
+    context_length: int
+        the number of items before the last item of a window
+
+    Returns
+    -------
+    windows: contextWindows
+        the window ending at each item but the last, at most context_length + 1 items long
+
+    next_items: tokenWindow
+        a read-only view of the item after each window
+
+    .. versionadded:: 0.0.0
+    """
+    windows = np.asarray(items)
+    ends = np.arange(1, max(len(windows), 1))
+    windows = contextWindows(windows, np.maximum(0, ends - 1 - context_length), ends)
+
+    return windows, windows.tokens[1:].view(tokenWindow)
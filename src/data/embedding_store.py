@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from src.utilities.model_registry import registry
+
+
+class embeddingStore:
+
+    def __init__(self, directory):
+        """Opens word embeddings converted by convert_glove
+
+        Parameters
+        ----------
+        directory : str
+            the folder written by convert_glove
+
+        Notes
+        -----
+        The arrays are memory-mapped read-only, so opening the store reads no vectors and every
+        process using the same store shares the pages of the operating system cache
+
+        .. versionadded:: 0.0.0
+        """
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+
+        self.directory = directory
+        self.vectors = self._open('vectors')
+        self.mean_vector = self._open('mean')
+        self.words = self._open('words')
+        self._hashes = self._open('hashes')
+        self._order = self._open('order')
+
+    def lookup(self, words):
+        """Finds the row of the embedding of each word
+
+        Parameters
+        ----------
+        words : list
+            the words to look up
+
+        Returns
+        -------
+        rows: ndarray
+            the row in vectors of each word and -1 for the words without an embedding
+
+        .. versionadded:: 0.0.0
+        """
+        words = [str(word) for word in words]
+        hashes = word_hashes(words)
+
+        if len(self._hashes) == 0:
+            return np.full(len(words), -1, dtype=np.int64)
+
+        positions = np.minimum(np.searchsorted(self._hashes, hashes), len(self._hashes) - 1)
+        rows = np.where(self._hashes[positions] == hashes, self._order[positions], -1)
+
+        # a hash collision with a different word is treated as an unknown word
+        for i in np.flatnonzero(rows >= 0):
+            if self.words[rows[i]] != words[i]:
+                rows[i] = -1
+
+        return rows
+
+    def _open(self, name):
+        return np.load(os.path.join(self.directory, name + '.npy'), mmap_mode='r')
+
+
+def word_hashes(words):
+    """Returns a stable 64 bit hash of each word"""
+
+    return np.array([int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'little')
+                     for word in words], dtype=np.uint64)
+
+
+def convert_glove(file, directory, limit=100000):
+    """Converts a GloVe text file into memory-mappable arrays
+
+    Parameters
+    ----------
+    file : str
+        path to a GloVe file, a word followed by the values of its embedding on each line
+
+    directory: str
+        the folder the arrays are written to
+
+    limit: int, optional
+        the number of embeddings, from the top of the file, that are kept
+
+    Notes
+    -----
+    The file is read once. The first limit embeddings are saved as a float32 matrix along with
+    the mean of every embedding in the file, which stands in for unknown words. The vocabulary
+    is indexed by a sorted array of word hashes and the row of each hash, so a lookup is a
+    binary search. The manifest is written last and records the size and modification time of
+    the source so a changed file is converted again
+
+    .. versionadded:: 0.0.0
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    words = []
+    vectors = []
+    total = None
+    count = 0
+    with open(file, 'r', encoding='utf-8') as f:
+        for line in f:
+            values = line.rstrip('\n').rstrip(' ').split(' ')
+            if total is None:
+                dimension = len(values) - 1
+                total = np.zeros(dimension, dtype=np.float64)
+            vector = np.array(values[-dimension:], dtype=np.float32)
+            total += vector
+            count += 1
+            if len(words) < limit:
+                # a few embeddings files have words containing spaces
+                words.append(' '.join(values[:-dimension]))
+                vectors.append(vector)
+
+    if total is None:
+        raise ValueError('The embedding file ' + file + ' is empty')
+
+    hashes = word_hashes(words)
+    order = np.argsort(hashes, kind='stable')
+
+    arrays = {'vectors': np.array(vectors, dtype=np.float32), 'mean': (total / count).astype(np.float32),
+              'words': np.array(words, dtype=str), 'hashes': hashes[order], 'order': order.astype(np.int64)}
+    # the files are replaced rather than overwritten, as other processes may have them mapped, and
+    # each is written to a unique temporary file so two processes converting at once do not collide
+    for name, array in arrays.items():
+        with tempfile.NamedTemporaryFile(dir=directory, suffix='.tmp', delete=False) as f:
+            np.save(f, array)
+        os.replace(f.name, os.path.join(directory, name + '.npy'))
+
+    manifest = dict(_source_description(file), limit=limit, dimension=dimension, embeddings=count)
+    with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.tmp', delete=False) as f:
+        json.dump(manifest, f)
+    os.replace(f.name, os.path.join(directory, 'manifest.json'))
+
+
+def load_embeddings(file, directory=None, limit=100000):
+    """Opens the embedding store of a GloVe file, converting the file the first time
+
+    Parameters
+    ----------
+    file : str
+        path to a GloVe file
+
+    directory: str, optional
+        the folder of the store. When not given it is a folder named after the file, inside
+        the EMBEDDING_STORE_DIR environment variable when that is set and next to the file
+        otherwise
+
+    limit: int, optional
+        the number of embeddings, from the top of the file, that are kept
+
+    Returns
+    -------
+    store: embeddingStore
+        the store, shared with the other users in the process through the model registry
+
+    .. versionadded:: 0.0.0
+    """
+    if directory is None:
+        parent = os.environ.get('EMBEDDING_STORE_DIR')
+        if parent is None:
+            directory = file + '.store'
+        else:
+            directory = os.path.join(parent, os.path.basename(file) + '.store')
+
+    expected = dict(_source_description(file), limit=limit)
+    manifest_path = os.path.join(directory, 'manifest.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        current = all(manifest.get(name) == value for name, value in expected.items())
+    else:
+        current = False
+
+    if not current:
+        registry.release(('embeddings', os.path.abspath(directory)))
+        convert_glove(file, directory, limit)
+
+    return registry.get(('embeddings', os.path.abspath(directory)), lambda: embeddingStore(directory))
+
+
+def _source_description(file):
+    status = os.stat(file)
+    return {'source_size': status.st_size, 'source_mtime': status.st_mtime}
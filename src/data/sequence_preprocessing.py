@@ -1,16 +1,29 @@
 from collections import Counter
+import time
 import warnings
 import mne.evoked
 import numpy as np
-from gensim.models import KeyedVectors
-from gensim.scripts.glove2word2vec import glove2word2vec
-from scipy.stats import pearsonr
-from transformers import GPT2Tokenizer, TransfoXLTokenizer, CTRLTokenizer
+from transformers import GPT2Tokenizer, GPT2TokenizerFast, TransfoXLTokenizer, CTRLTokenizer
+
+from src.data.context_windows import sliding_windows
+from src.data.embedding_store import load_embeddings
+from src.data.token_store import default_store
+from src.utilities.model_registry import registry
+
+SUPPORTED_MODELS = ('gpt2', 'gpt2-xl', 'txl', 'ctrl')
+
+# the models with a compiled tokenizer from the tokenizers package in this version of transformers
+FAST_TOKENIZER_MODELS = ('gpt2', 'gpt2-xl')
+
+UNSUPPORTED_MODEL_MESSAGE = (
+    ' The model parameter passed is not currently supported. Language Models currently supported are \n'
+    'GPT2, GPT2 XL,  Transformer XL, and CTRL. The codes for these model are [\'gpt2\', \'gpt2-xl\', \'txl\' and \'ctrl\'] '
+    'resecptivly')
 
 
 class sequence_processor():
 
-    def __init__(self, modelType, text):
+    def __init__(self, modelType, text, tokenizer_backend='slow'):
 
         if (modelType == None or text == None):
             raise TypeError
@@ -18,10 +31,32 @@ class sequence_processor():
         if (type(modelType) != str or type(text) != str):
             raise TypeError
 
-        self.tokenizer = self._loadTokenizer(modelType)
+        if modelType not in SUPPORTED_MODELS:
+            print('\n')
+            raise NameError(UNSUPPORTED_MODEL_MESSAGE)
+
+        if tokenizer_backend not in ('slow', 'fast'):
+            raise ValueError('Unknown tokenizer backend ' + str(tokenizer_backend) + ', the backends available '
+                             'are \'slow\' and \'fast\'')
+
+        if tokenizer_backend == 'fast' and modelType not in FAST_TOKENIZER_MODELS:
+            raise ValueError('The fast tokenizer is only available for the gpt2 and gpt2-xl models')
+
+        self.modelType = modelType
         self.text = text
+        self.tokenizer_backend = tokenizer_backend
+
+    @property
+    def tokenizer(self):
+        """The tokenizer of the model, loaded the first time it is used and shared through the model registry"""
+
+        if self.tokenizer_backend == 'fast':
+            return registry.get(('tokenizer', self.modelType, 'fast'), lambda: self._loadFastTokenizer(self.modelType))
+
+        return registry.get(('tokenizer', self.modelType), lambda: self._loadTokenizer(self.modelType))
 
-    def _loadTokenizer(self, modelType):
+    @staticmethod
+    def _loadTokenizer(modelType):
         """Loads a tokenizer from one of the Languge models based on the modelType parameter
 
         Parameters
@@ -46,15 +81,101 @@ class sequence_processor():
             return tokenizer
         else:
             print('\n')
-            raise NameError(
-                ' The model parameter passed is not currently supported. Language Models currently supported are \n'
-                'GPT2, GPT2 XL,  Transformer XL, and CTRL. The codes for these model are [\'gpt2\', \'gpt2-xl\', \'txl\' and \'ctrl\'] '
-                'resecptivly')
+            raise NameError(UNSUPPORTED_MODEL_MESSAGE)
+
+    @staticmethod
+    def _loadFastTokenizer(modelType):
+        """Loads the compiled tokenizer of the tokenizers package for modelType
+
+        Parameters
+        ----------
+        modelType : string
+            String specifying the language model that the tokenizer will be loaded
+
+        Notes
+        -----
+        The prefix space of the words after the first is added to the words themselves, so the
+        tokenizer is loaded without add_prefix_space
+
+        .. versionadded:: 0.0.0
+        """
+        if modelType not in FAST_TOKENIZER_MODELS:
+            raise ValueError('The fast tokenizer is only available for the gpt2 and gpt2-xl models')
+
+        return GPT2TokenizerFast.from_pretrained(modelType, add_prefix_space=False)
+
+    def tokenizeWords(self, first_word_index=0, store=None):
+        """Tokenizes the text, each word in the text is converted to an integer that maps to a dictionary of word
+
+        Parameters
+        ----------
+        first_word_index: int, optional
+            the position of the first word of the text in a longer stream of words that is
+            tokenized in parts, the GPT-2 tokens of a word depend on whether it starts the stream
+
+        store: tokenStore, optional
+            the store of pre-tokenized texts, default_store() is used when not given and False
+            turns it off. A text found in the store is read from its memory-mapped file without
+            loading the tokenizer
+
+        Notes
+        -----
+        sequence_processor variable indexed_tokens is set
+        sequence_processor variable word_ids is set, it holds the position in the text of the
+        word each token belongs to
+        sequence_processor variable word_offsets is set, it holds the index of the first token
+        of each word and the number of tokens as its last value
+
+        .. versionadded:: 0.0.0
+        """
+        if store is None:
+            store = default_store()
+
+        if self._loadStoredTokens(store, first_word_index):
+            return
+
+        words = self.text.split(' ')
+        if self.tokenizer_backend == 'fast':
+            word_tokens = _encode_fast(self.tokenizer, [words], [first_word_index])[0]
+        else:
+            # each word is encoded on its own, which gives the same tokens as encoding the whole
+            # text as no token crosses the spaces between words
+            word_tokens = []
+            for i, word in enumerate(words):
+                if (self.modelType == 'gpt2' or self.modelType == 'gpt2-xl'):
+                    word_tokens.append(self.tokenizer.encode(word, add_prefix_space=first_word_index + i > 0))
+                else:
+                    word_tokens.append(self.tokenizer.encode(word))
+
+        self._setWordTokens(word_tokens, store, first_word_index)
+
+    def _loadStoredTokens(self, store, first_word_index):
+        """Sets the tokens of the text from the token store, returns False when they are not stored"""
+
+        # only whole texts are stored, the parts of a stream are tokenized each time
+        if not store or first_word_index != 0:
+            return False
+
+        stored = store.load(store.key(self.modelType, self.text, self.tokenizer_backend))
+        if stored is None:
+            return False
+
+        tokens, self.word_ids, self.word_offsets = stored
+        self.indexed_tokens = tokens.tolist()
 
-    def tokenizeWords(self):
-        """Tokenizes the text, each word in the text is converted to an integer that maps to a dictionary of word """
+        return True
 
-        self.indexed_tokens = self.tokenizer.encode(self.text)
+    def _setWordTokens(self, word_tokens, store, first_word_index):
+        """Sets the tokens of the text from the tokens of each word and adds them to the token store"""
+
+        lengths = [len(tokens) for tokens in word_tokens]
+        self.indexed_tokens = [token for tokens in word_tokens for token in tokens]
+        self.word_ids = np.repeat(np.arange(len(word_tokens), dtype=np.int64), lengths)
+        self.word_offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]).astype(np.int64)
+
+        if store and first_word_index == 0:
+            key = store.key(self.modelType, self.text, self.tokenizer_backend)
+            store.store(key, self.indexed_tokens, self.word_ids, self.word_offsets)
 
     def text_to_sequences(self, contextLength):
         """Creates sequences of indexed token from the self.indexed_tokens
@@ -66,7 +187,8 @@ class sequence_processor():
 
         Notes
         -----
-        sequence_processor variable indexed_sequeces is set
+        sequence_processor variable indexed_sequeces is set, a contextWindows whose windows are
+        read-only views of one array of the indexed tokens
         sequence_processor variable indexed_nextWord is set
 
         .. versionadded:: 0.0.0
@@ -77,21 +199,8 @@ class sequence_processor():
             warnings.warn('The context length passed is longer than the text length, no sequence will\n'
                           'match the length of context specified')
 
-        number_of_sequences = len(self.indexed_tokens)
-
-        sequences = [None] * (number_of_sequences - 1)
-        nextWord = [None] * (number_of_sequences - 1)
-
-        for i in range(number_of_sequences - 1):
-            if (i <= contextLength):
-                sequences[i] = self.indexed_tokens[0:i + 1]
-                nextWord[i] = self.indexed_tokens[i + 1]
-            else:
-                sequences[i] = self.indexed_tokens[i - contextLength:i + 1]
-                nextWord[i] = self.indexed_tokens[i + 1]
-
-        self.indexed_sequences = sequences
-        self.indexed_nextWord = nextWord
+        self.indexed_sequences, self.indexed_nextWord = sliding_windows(
+            np.asarray(self.indexed_tokens, dtype=np.int64), contextLength)
 
     def text_to_word_sequences(self, context_length):
         """Creates sequences of words from the self.text
@@ -103,8 +212,8 @@ class sequence_processor():
 
         Notes
         -----
-        sequence_processor variable indexed_sequeces is set
-        sequence_processor variable indexed_nextWord is set
+        sequence_processor variable word_sequences is set, a contextWindows over an array of the words
+        sequence_processor variable word_nextWord is set
 
         .. versionadded:: 0.0.0
         """
@@ -113,22 +222,8 @@ class sequence_processor():
             warnings.warn('The context length passed is longer than the text length, no sequence will\n'
                           'match the length of context specified')
 
-        word_list = self.text.split(' ')
-
-        number_of_sequences = len(word_list)
-        sequences = [None] * (number_of_sequences - 1)
-        nextWord = [None] * (number_of_sequences - 1)
-
-        for i in range(number_of_sequences - 1):
-            if (i <= context_length):
-                sequences[i] = word_list[0:i + 1]
-                nextWord[i] = word_list[i + 1]
-            else:
-                sequences[i] = word_list[i - context_length:i + 1]
-                nextWord[i] = word_list[i + 1]
-
-        self.word_sequences = sequences
-        self.word_nextWord = nextWord
+        word_list = np.array(self.text.split(' '))
+        self.word_sequences, self.word_nextWord = sliding_windows(word_list, context_length)
 
     def word_frequency_length(self):
         """ Calculates the length and frequency of each word in self.text
@@ -149,7 +244,7 @@ class sequence_processor():
 
 
     # TODO Fix for condition when the no word in the sequence is in the embedding file
-    def calc_semantic_dissimilarity(self, file):
+    def calc_semantic_dissimilarity(self, file, embedding_directory=None):
         """ claculates the sematic dissimilarity of a glove embedding from the previous X glove
             embeddings. X is determined by the context length which sets the sequences length
         Parameters
@@ -157,53 +252,193 @@ class sequence_processor():
         file: sting
             path to a file that contains word embeddings eg glove, word2vec
 
+        embedding_directory: str, optional
+            the folder of the converted embeddings, see embedding_store.load_embeddings
+
         Notes
         -----
-        sequence_processor variable semantic_dissimilarity is set
+        sequence_processor variable semantic_dissimilarity is set. The embedding file is
+        converted to a memory-mapped store the first time it is used, later calls open the store.
+        The dissimilarity of every word is computed at once, see rolling_dissimilarity
 
         .. versionadded:: 0.0.0
         """
 
-        word2vec_output_file = file + 'word2vec'
-        glove2word2vec(file, word2vec_output_file)
-        filename = file + 'word2vec'
-        glove = KeyedVectors.load_word2vec_format(filename, binary=False, limit=100000)
-
-        # calculate unknown embedding by taking average of all embeddings
-        with open(file, 'r') as f:
-            for i, line in enumerate(f):
-                pass
-        number_of_embeddings = i + 1
-        embedding_dimension = len(line.split(' ')) - 1
-
-        all_embeddings_vector = np.zeros((number_of_embeddings, embedding_dimension), dtype=np.float32)
-
-        with open(file, 'r') as f:
-            for i, line in enumerate(f):
-                all_embeddings_vector[i] = np.array([float(n) for n in line.split(' ')[1:]], dtype=np.float32)
-
-        unknown_token = np.mean(all_embeddings_vector, axis=0)
-
-        # Calculate the average embedding for each sequence
-        average_embedding = []
-        for sequence in self.word_sequences:
-            word_embeddings = []
-            for word in sequence:
-                if word in glove.vocab:
-                    word_embeddings.append(glove[word])
-
-            average_embedding.append(np.sum(word_embeddings, axis=0) / len(word_embeddings))
-
-        # Calculate the disimilarity by 1 minus the pearson correlation of a word and the
-        # preceding sequence
-        semantic_dissim = []
-        for word in range(0, len(self.word_nextWord)):
-            if self.word_nextWord[word] in glove.vocab:
-                dissim = 1 - pearsonr(glove[self.word_nextWord[word]], average_embedding[word])[0]
-                semantic_dissim.append(dissim)
-            else:
-                dissim = 1 - pearsonr(unknown_token, average_embedding[word])[0]
-                semantic_dissim.append(dissim)
+        embeddings = load_embeddings(file, embedding_directory)
+
+        # the row of the embedding of every word of the text, the windows index into it
+        rows = embeddings.lookup(self.word_sequences.tokens)
+        semantic_dissim = rolling_dissimilarity(embeddings, rows, self.word_sequences.starts,
+                                                self.word_sequences.ends).tolist()
 
         semantic_dissim.insert(0, 0)
         self.Semantic_disimilarity = semantic_dissim
+
+
+def rolling_dissimilarity(embeddings, rows, starts, ends):
+    """ Calculates 1 minus the Pearson correlation of the embedding of each word after a window
+        with the mean embedding of the known words in the window
+
+    Parameters
+    ----------
+    embeddings: embeddingStore
+        the word embeddings
+
+    rows: ndarray
+        the row in embeddings of every word of the text, -1 for the unknown words
+
+    starts: ndarray
+        the position of the first word of each window
+
+    ends: ndarray
+        the position after the last word of each window, the word at ends is compared with it
+
+    Returns
+    -------
+    dissimilarity: ndarray
+        one value per window, NaN for a window without a known word
+
+    Notes
+    -----
+    The sum of the known embeddings of a window is the difference of two rows of their
+    cumulative sum, so the means of all the windows cost one pass over the text whatever the
+    context length. An unknown word after a window is given the mean of every embedding. The
+    correlations are the dot products of the centred and normalised rows
+
+    .. versionadded:: 0.0.0
+    """
+    known = rows >= 0
+    word_vectors = np.asarray(embeddings.vectors)[np.maximum(rows, 0)].astype(np.float64)
+    word_vectors[~known] = 0
+
+    cumulative = np.concatenate([np.zeros((1, word_vectors.shape[1])), np.cumsum(word_vectors, axis=0)])
+    known_count = np.concatenate([[0], np.cumsum(known)])
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = (cumulative[ends] - cumulative[starts]) / (known_count[ends] - known_count[starts])[:, None]
+
+    targets = np.where(known[ends][:, None], word_vectors[ends], np.asarray(embeddings.mean_vector, dtype=np.float64))
+
+    means = means - means.mean(axis=1, keepdims=True)
+    targets = targets - targets.mean(axis=1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        correlation = (means * targets).sum(axis=1) / np.sqrt((means ** 2).sum(axis=1) * (targets ** 2).sum(axis=1))
+
+    return 1 - correlation
+
+
+def tokenize_texts(modelType, texts, tokenizer_backend='fast', store=None):
+    """Tokenizes several texts, the fast tokenizer encodes the words of all of them in one batch
+
+    Parameters
+    ----------
+    modelType : str
+        language model code of the tokenizer
+
+    texts: list
+        the texts to tokenize, each a string of words separated by spaces
+
+    tokenizer_backend: str, optional
+        'fast' for the compiled tokenizer or 'slow' for the Python tokenizer of transformers
+
+    store: tokenStore, optional
+        the store of pre-tokenized texts, default_store() is used when not given and False
+        tokenizes every text
+
+    Returns
+    -------
+    processors: list
+        a sequence_processor for each text with tokenizeWords already run
+
+    Notes
+    -----
+    The compiled tokenizer encodes a batch across all CPU cores, so pooling the words of
+    every text into one call amortises the cost of crossing into the tokenizer
+
+    .. versionadded:: 0.0.0
+    """
+    if store is None:
+        store = default_store()
+
+    processors = [sequence_processor(modelType, text, tokenizer_backend) for text in texts]
+    pending = [sp for sp in processors if not sp._loadStoredTokens(store, 0)]
+
+    if tokenizer_backend == 'fast':
+        if pending:
+            word_lists = [sp.text.split(' ') for sp in pending]
+            for sp, word_tokens in zip(pending, _encode_fast(pending[0].tokenizer, word_lists, [0] * len(pending))):
+                sp._setWordTokens(word_tokens, store, 0)
+    else:
+        for sp in pending:
+            sp.tokenizeWords(store=store)
+
+    return processors
+
+
+def _encode_fast(tokenizer, word_lists, first_word_indices):
+    """Encodes the words of several texts in one call to the compiled tokenizer
+
+    Returns
+    -------
+    word_tokens: list
+        for each text, the list of tokens of each of its words
+    """
+    # the space before a word is part of it, as add_prefix_space does in the slow tokenizer
+    texts = [word if first_word_index + i == 0 else ' ' + word
+             for words, first_word_index in zip(word_lists, first_word_indices) for i, word in enumerate(words)]
+    encodings = tokenizer.encode_batch(texts, return_token_type_ids=False, return_attention_mask=False) if texts else []
+
+    word_tokens = []
+    start = 0
+    for words in word_lists:
+        word_tokens.append([encoding['input_ids'] for encoding in encodings[start:start + len(words)]])
+        start += len(words)
+
+    return word_tokens
+
+
+def benchmark_tokenizers(modelType, texts, repeats=3):
+    """ Times tokenizing texts with the slow and the fast tokenizer and checks that they agree
+
+    Parameters
+    ----------
+    modelType : str
+        language model code of the tokenizers, gpt2 or gpt2-xl
+
+    texts: list
+        the texts to tokenize, each a string of words separated by spaces
+
+    repeats: int
+        the number of timed runs of each tokenizer, the fastest run is reported
+
+    Returns
+    -------
+    report : dict
+        the fastest run in seconds and the words per second of each tokenizer, and whether
+        they gave the same tokens for every text
+
+    .. versionadded:: 0.0.0
+    """
+    # texts read from the token store would not be tokenized at all
+    store = False
+
+    seconds = {}
+    tokens = {}
+    for tokenizer_backend in ('slow', 'fast'):
+        # the first run loads the tokenizer
+        tokenize_texts(modelType, texts[:1], tokenizer_backend, store)
+
+        runs = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            processors = tokenize_texts(modelType, texts, tokenizer_backend, store)
+            runs.append(time.perf_counter() - start)
+        seconds[tokenizer_backend] = min(runs)
+        tokens[tokenizer_backend] = [sp.indexed_tokens for sp in processors]
+
+    number_of_words = sum(len(text.split(' ')) for text in texts)
+
+    return {'slow_seconds': seconds['slow'], 'fast_seconds': seconds['fast'],
+            'slow_words_per_second': number_of_words / seconds['slow'],
+            'fast_words_per_second': number_of_words / seconds['fast'],
+            'identical': tokens['slow'] == tokens['fast']}
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+import transformers
+
+
+class tokenStore:
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, model_type, text, tokenizer='slow'):
+        """Creates the content address of the tokens of a text
+
+        Parameters
+        ----------
+        model_type : str
+            language model code of the tokenizer
+
+        text: str
+            the text that is tokenized
+
+        tokenizer: str, optional
+            the tokenizer implementation used
+
+        Returns
+        -------
+        key: str
+            hex digest naming the store entry
+
+        .. versionadded:: 0.0.0
+        """
+        text_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        description = {'model': model_type, 'tokenizer': tokenizer, 'transformers': transformers.__version__,
+                       'text': text_hash}
+
+        return hashlib.sha256(json.dumps(description, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def load(self, key):
+        """Opens the tokens stored under key without reading them into memory
+
+        Returns
+        -------
+        tokens: tuple
+            memory-mapped arrays of the token ids, the word id of each token and the offset of
+            the first token of each word, or None when the entry does not exist
+
+        .. versionadded:: 0.0.0
+        """
+        # the offsets are written last, so an entry with offsets is complete
+        if not os.path.exists(self._path(key, 'offsets')):
+            return None
+
+        return tuple(np.load(self._path(key, name), mmap_mode='r') for name in ('tokens', 'word_ids', 'offsets'))
+
+    def store(self, key, indexed_tokens, word_ids, word_offsets):
+        """Writes the token ids and word ids of a text under key
+
+        Parameters
+        ----------
+        key: str
+            the entry name from tokenStore.key
+
+        indexed_tokens: list
+            the token ids of the text
+
+        word_ids: ndarray
+            the position in the text of the word each token belongs to
+
+        word_offsets: ndarray
+            the index of the first token of each word followed by the number of tokens
+
+        .. versionadded:: 0.0.0
+        """
+        arrays = {'tokens': np.asarray(indexed_tokens, dtype=np.int64),
+                  'word_ids': np.asarray(word_ids, dtype=np.int64),
+                  'offsets': np.asarray(word_offsets, dtype=np.int64)}
+        for name in ('tokens', 'word_ids', 'offsets'):
+            self._save(self._path(key, name), arrays[name])
+
+    def load_decode_table(self, model_type):
+        """Opens the stored decode table of model_type, None when it has not been stored
+
+        .. versionadded:: 0.0.0
+        """
+        path = self._path(self._decode_key(model_type), 'decode')
+        if not os.path.exists(path):
+            return None
+
+        return np.load(path, mmap_mode='r')
+
+    def store_decode_table(self, model_type, decode_table):
+        """Writes the decode table of model_type as a fixed width string array
+
+        .. versionadded:: 0.0.0
+        """
+        self._save(self._path(self._decode_key(model_type), 'decode'), np.asarray(decode_table, dtype=str))
+
+    def _decode_key(self, model_type):
+        return model_type + '-' + transformers.__version__
+
+    def _save(self, path, array):
+        # a unique temporary file, so processes storing the same text do not write into one file
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False) as f:
+            np.save(f, array)
+        os.replace(f.name, path)
+
+    def _path(self, key, name):
+        return os.path.join(self.directory, key + '.' + name + '.npy')
+
+
+def default_store():
+    """Returns the token store in the TOKEN_STORE_DIR environment variable or None when it is not set"""
+
+    directory = os.environ.get('TOKEN_STORE_DIR')
+    if directory is None:
+        return None
+
+    return tokenStore(directory)
@@ -0,0 +1,71 @@
+import asyncio
+import json
+
+from src.features.scoring_server import microBatcher
+
+
+class asyncScorer:
+
+    def __init__(self, max_delay=0.01, max_words=20000, max_tokens=4096):
+        self.batcher = microBatcher(max_delay, max_words, max_tokens)
+        self.deduplicated = 0
+        self._in_flight = {}
+
+    async def word_surprisal(self, model_type, clean_words, context=50, **scoring_options):
+        """ Calculates the surprisal of each word, sharing forward passes with the other coroutines
+
+        Parameters
+        ----------
+        model_type : str
+            language model code to select the model to calculate surprisal
+
+        clean_words: list
+            list of words already cleaned by preprocessing_text.clean_text
+
+        context: int
+            the amount of words to be consided as context for caculating surprisal
+
+        scoring_options:
+            keyword arguments passed on to batch_word_surprisal, eg statistics
+
+        Returns
+        -------
+        covariates : DataFrame
+            the same columns as word_surprisal, a copy owned by the caller
+
+        Notes
+        -----
+        The texts submitted while a batch is being collected are scored together by the
+        batching thread, which runs the model outside the event loop. A request identical to
+        one that is still being scored waits for that result instead of being scored again
+
+        .. versionadded:: 0.0.0
+        """
+        self.batcher.start()
+
+        key = (model_type, context, tuple(clean_words), json.dumps(scoring_options, sort_keys=True))
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.wrap_future(self.batcher.submit(model_type, clean_words, context, scoring_options))
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.deduplicated += 1
+
+        covariates = await asyncio.shield(future)
+
+        return covariates.copy()
+
+    async def close(self):
+        """Stops the batching thread once the submitted texts are scored
+
+        .. versionadded:: 0.0.0
+        """
+        await asyncio.get_running_loop().run_in_executor(None, self.batcher.stop)
+
+    async def __aenter__(self):
+        self.batcher.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
@@ -1,57 +1,94 @@
-import math
+import hashlib
+import json
+import os
+import time
+import warnings
 
+import numpy as np
+import pandas as pd
 import torch
-from transformers import GPT2Tokenizer, GPT2LMHeadModel, TransfoXLTokenizer, TransfoXLLMHeadModel, CTRLTokenizer, \
-    CTRLLMHeadModel
+import transformers
+from transformers import GPT2LMHeadModel, TransfoXLLMHeadModel, CTRLLMHeadModel
+from transformers.modeling_utils import Conv1D
+
+from src.data.context_windows import contextWindows
+from src.data.sequence_preprocessing import sequence_processor, tokenize_texts
+from src.data.token_store import default_store
+from src.data.text_preprocessing import preprocessing_text
+from src.features.layer_streaming import layerStreamedModel, STREAMED_MODELS, STREAMED_MAX_TOKENS
+from src.utilities.model_registry import registry, memory_footprint
+
+# the longest time, in seconds, a scored batch waits in the operating system before the checkpoint is synced
+CHECKPOINT_SYNC_SECONDS = 5
 
 
 class languageModel:
 
-    def __init__(self, modelType):
-        self.tokenizer, self.model = self.modelLoader(modelType)
+    def __init__(self, modelType, quantize=False, backend='eager', trace_directory=None, layer_directory=None):
+        if backend not in ('eager', 'torchscript', 'layer_streamed'):
+            raise ValueError('Unknown backend ' + str(backend) + ', the backends available are \'eager\', '
+                             '\'torchscript\' and \'layer_streamed\'')
+
+        self.modelType = modelType
+        self.quantize = quantize
+        self.backend = backend
+        if trace_directory is None:
+            trace_directory = os.environ.get('LM_TRACE_CACHE_DIR')
+        self.trace_directory = trace_directory
+        # the tokenizer and model are loaded once per process and shared between instances
+        if backend == 'layer_streamed':
+            # only the tokenizer is loaded, the weights are read from layer_directory as they are used
+            if layer_directory is None:
+                layer_directory = os.environ.get('LM_LAYER_DIR')
+            if layer_directory is None or modelType not in STREAMED_MODELS:
+                raise ValueError('Layer streaming needs a layer_directory written by export_layers and is only '
+                                 'available for ' + ', '.join(STREAMED_MODELS))
+            self.model = registry.get(('layers', modelType, layer_directory),
+                                      lambda: layerStreamedModel(layer_directory))
+        elif quantize:
+            self.model = registry.get(('model', modelType, 'int8'), lambda: self.quantizedModelLoader(modelType))
+        else:
+            self.model = registry.get(('model', modelType), lambda: self.modelLoader(modelType))
+        self.statistics = {}
+
+    @property
+    def tokenizer(self):
+        """The tokenizer of the model, shared with sequence_processor and only loaded when it is used"""
+
+        return registry.get(('tokenizer', self.modelType), lambda: sequence_processor._loadTokenizer(self.modelType))
 
     def modelLoader(self, modelType):
-        """Loads a tokenizer and model from one of the Languge models based on the modelType parameter
+        """Loads a model from one of the Languge models based on the modelType parameter
 
         Parameters
         ----------
         modelType : string
-            String specifying the language model that the tokenizer will be loaded
+            String specifying the language model that will be loaded
 
         Returns
         -------
-        tokenizer:
-            The tokenizer corresponding to the modelType string
-
         model:
             The language model type correpsonding to the modelType string
 
+        Notes
+        -----
+        The tokenizer is not loaded here, languageModel.tokenizer loads it the first time it is
+        used, so a text read from the token store is scored without it
+
         .. versionadded:: 0.0.0
         """
         if (modelType == 'gpt2'):
-            tokenizer = GPT2Tokenizer.from_pretrained('gpt2')
             model = GPT2LMHeadModel.from_pretrained('gpt2')
-            return tokenizer, model
 
         elif (modelType == 'gpt2-xl'):
-
-            tokenizer = GPT2Tokenizer.from_pretrained('gpt2-xl')
             model = GPT2LMHeadModel.from_pretrained('gpt2-xl')
 
-            return tokenizer, model
-
         elif (modelType == 'txl'):
-            tokenizer = TransfoXLTokenizer.from_pretrained('transfo-xl-wt103')
             model = TransfoXLLMHeadModel.from_pretrained('transfo-xl-wt103')
 
-            return tokenizer, model
-
         elif (modelType == 'ctrl'):
-            tokenizer = CTRLTokenizer.from_pretrained('ctrl')
             model = CTRLLMHeadModel.from_pretrained('ctrl')
 
-            return tokenizer, model
-
         else:
             print('\n')
 
@@ -61,7 +98,40 @@ class languageModel:
                 ' and \'ctrl\'] '
                 'resecptivly')
 
-    def word_probability(self, seqs, nextWord):
+        return model
+
+    def quantizedModelLoader(self, modelType):
+        """Loads a model whose linear layers are dynamically quantized to int8
+
+        Parameters
+        ----------
+        modelType : string
+            String specifying the language model that will be loaded
+
+        Returns
+        -------
+        model:
+            The quantized language model, which only runs on the CPU
+
+        Notes
+        -----
+        The weights of the linear layers are stored as int8 and the activations are quantized on
+        the fly, so the surprisal values differ slightly from the fp32 model. quantization_report
+        measures the difference. GPT-2 keeps its projections in Conv1D modules, which are turned
+        into the equivalent nn.Linear modules first so that they are quantized as well
+
+        .. versionadded:: 0.0.0
+        """
+        model = self.modelLoader(modelType)
+        model.eval()
+        _conv1d_to_linear(model)
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+        return model
+
+    def word_probability(self, seqs, nextWord, stride=None, max_tokens=None, incremental=False,
+                         segment_length=None, statistics=None, top_k=10, workers=None, threads_per_worker=None,
+                         checkpoint=None):
         """calculates the probability the langage models assigns the the next word after a sequence
 
         Parameters
@@ -74,46 +144,893 @@ class languageModel:
             A list of indexed token used in the function to select the correct word
             from the models proability distribution
 
+        stride: int, optional
+            When set the token stream is scored with overlapping windows that advance by
+            stride tokens. Each window is passed through the model once and the probability
+            of every new token in the window is read from the logits of that single pass.
+            A stride of 1 gives the same probabilities as scoring each sequence on its own
+
+        max_tokens: int, optional
+            When set the sequences are grouped by length into padded batches holding at most
+            max_tokens tokens (rows times padded length) and each batch is passed through the
+            model in a single call. The layer_streamed backend reads every transformer block
+            once per batch, so it batches with a budget of STREAMED_MAX_TOKENS when not set
+
+        incremental: bool, optional
+            When True the text is fed to the model one token at a time and the attention key/value
+            states of the previous tokens are carried forward, trimmed to the context length, so
+            each token costs about one token of compute. Only for the models that take past
+            states: gpt2, gpt2-xl and ctrl. Cannot be combined with stride or max_tokens
+
+        segment_length: int, optional
+            Transformer-XL only. When set the whole text is streamed through the model in
+            segments of segment_length tokens and the recurrence memory (mems) of each segment
+            is passed to the next, so every token is scored with the context held in the model's
+            memory (mem_len tokens) instead of the sequences. Cannot be combined with the other
+            scoring options
+
+        statistics: list, optional
+            names of extra statistics of the next-token distribution to compute from the same
+            logits: 'entropy' (in bits), 'rank' (1 for the most likely token) and 'top_k' (the
+            probability mass of the top_k most likely tokens)
+
+        top_k: int, optional
+            the number of tokens summed for the 'top_k' statistic
+
+        workers: int, optional
+            When more than one the batches of windows are split across that many CPU worker
+            processes, which share the model weights through shared memory. The batches are the
+            same as in a serial run, so the merged result matches it. Cannot be combined with
+            incremental or segment_length
+
+        threads_per_worker: int, optional
+            the number of intra-op threads each worker uses, the available threads are divided
+            between the workers when not set
+
+        checkpoint: str, optional
+            a file the scores are appended to after every batch. When the file already holds
+            batches of the same job they are read back instead of scored again, so an interrupted
+            job resumes where it stopped and gives the same result, bit for bit, as a job that
+            was never interrupted. Cannot be combined with incremental, segment_length or workers
+
         Returns
         -------
-        probability: float
-            a logit proability value for each word in the text
+        log_probability: ndarray
+            the natural log probability of each token in the text
+
+        statistics: dict
+            an array for each of the requested statistics
+
+        probability: list
+            a proability value for each word in the text
 
         word: list
             A list of decoded words from the text
 
         .. versionadded:: 0.0.0
         """
-        device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+        device = self._device()
 
         self.model.to(device)
+        self._set_statistics(statistics, top_k)
 
-        probability = [None] * len(seqs)
-        decodedText = [None] * len(seqs)
+        if self.backend == 'layer_streamed' and (segment_length is not None or incremental):
+            raise ValueError('Layer streamed scoring cannot be combined with incremental or segment_length')
 
-        # defining the softmax function
-        sft = torch.nn.Softmax(dim=0)
+        if checkpoint is not None and (segment_length is not None or incremental):
+            raise ValueError('Checkpointed scoring cannot be combined with incremental or segment_length')
 
-        for i in range(len(seqs)):
-            input_ids = torch.tensor(seqs[i]).unsqueeze(0)
-            input_ids = input_ids.to(device)
+        if workers is not None and (segment_length is not None or incremental):
+            raise ValueError('Multi-process scoring cannot be combined with incremental or segment_length')
 
-            with torch.no_grad():
-                output = self.model(input_ids)
-                predictions = output[0]
+        if segment_length is not None:
+            if stride is not None or max_tokens is not None or incremental:
+                raise ValueError('Recurrent scoring cannot be combined with stride, max_tokens or incremental')
+            scores = self._recurrent_log_probability(seqs, nextWord, segment_length, device)
+
+        elif incremental:
+            if stride is not None or max_tokens is not None:
+                raise ValueError('Incremental scoring cannot be combined with stride or max_tokens')
+            scores = self._incremental_log_probability(seqs, nextWord, device)
 
-            predicted_probabilities = sft(predictions[0, -1])
-            next_wrd_prob = predicted_probabilities[nextWord[i]].item()
-            decodedText[i] = self.tokenizer.decode(nextWord[i])
-            probability[i] = next_wrd_prob
+        else:
+            if stride is None:
+                windows = seqs
+                lengths = seqs.lengths.tolist() if isinstance(seqs, contextWindows) else [len(seq) for seq in seqs]
+                reads = [([length - 1], [target]) for length, target in zip(lengths, nextWord)]
+            else:
+                windows, reads = self._strided_windows(seqs, nextWord, stride)
 
-        self.probability = probability
+            scores = self._score_windows(windows, reads, device, max_tokens, workers, threads_per_worker,
+                                         checkpoint)
+        decodedText = self.decode_tokens(nextWord)
+
+        self.log_probability = scores.pop('log_probability')
+        self.statistics = scores
+        self.probability = np.exp(self.log_probability).tolist()
         self.word = decodedText
 
-    # TODO Use a filter to get rid of elements
+    def context_sweep(self, indexed_tokens, contexts, max_tokens=None, statistics=None, top_k=10, workers=None,
+                      threads_per_worker=None, checkpoint=None):
+        """calculates the probability of every token for several context lengths in one pass
+
+        Parameters
+        ----------
+        indexed_tokens : list
+            the indexed tokens of the whole text, sequence_processor.indexed_tokens
+
+        contexts: list
+            the context lengths, each gives the same probabilities as text_to_sequences(context)
+            followed by word_probability
+
+        max_tokens: int, optional
+            the token budget of the padded batches, see word_probability
+
+        statistics: list, optional
+            names of extra statistics of the next-token distribution, see word_probability
+
+        top_k: int, optional
+            the number of tokens summed for the 'top_k' statistic
+
+        workers: int, optional
+            the number of CPU worker processes, see word_probability
+
+        threads_per_worker: int, optional
+            the number of intra-op threads each worker uses
+
+        checkpoint: str, optional
+            a file to checkpoint the finished batches to, see word_probability
+
+        Returns
+        -------
+        log_probability: ndarray
+            the natural log probability of each token after the first, one row per context length
+
+        statistics: dict
+            an array with one row per context length for each of the requested statistics
+
+        probability: list
+            the probabilities of each row of log_probability
+
+        word: list
+            A list of decoded words from the text
+
+        Notes
+        -----
+        A window starting at token s and as long as the longest context holds, at its offset c,
+        the prediction of token s + c + 1 from the c + 1 tokens before it. The model is causal
+        so the tokens after an offset do not change it, and a single pass over each window gives
+        the prediction for every context length at once. The sweep therefore costs about one
+        run at the longest context.
+
+        .. versionadded:: 0.0.0
+        """
+        device = self._device()
+
+        self.model.to(device)
+        self._set_statistics(statistics, top_k)
+
+        window_length = max(contexts) + 1
+        starts = {}
+        for row, context in enumerate(contexts):
+            for i in range(len(indexed_tokens) - 1):
+                start = max(0, i - context)
+                starts.setdefault(start, []).append((row, i, i - start))
+
+        window_starts = np.array(sorted(starts), dtype=np.int64)
+        windows = contextWindows(np.asarray(indexed_tokens, dtype=np.int64), window_starts,
+                                 np.minimum(window_starts + window_length, len(indexed_tokens)))
+        reads = []
+        order = []
+        for start in window_starts.tolist():
+            reads.append(([offset for _, _, offset in starts[start]],
+                          [indexed_tokens[i + 1] for _, i, _ in starts[start]]))
+            order.extend((row, i) for row, i, _ in starts[start])
+
+        rows, positions = zip(*order) if order else ((), ())
+        scores = {}
+        for name, values in self._score_windows(windows, reads, device, max_tokens, workers,
+                                                 threads_per_worker, checkpoint).items():
+            scores[name] = np.zeros((len(contexts), len(indexed_tokens) - 1))
+            scores[name][list(rows), list(positions)] = values
+
+        self.log_probability = scores.pop('log_probability')
+        self.statistics = scores
+        self.probability = np.exp(self.log_probability).tolist()
+        self.word = self.decode_tokens(indexed_tokens[1:])
+
+    def _strided_windows(self, seqs, nextWord, stride):
+        """Rebuilds the token stream from the sequences and cuts it into strided windows
+
+        Parameters
+        ----------
+        seqs : 2D list
+            the sequences created by sequence_processor.text_to_sequences
+
+        nextWord: list
+            the token that follows each sequence
+
+        stride: int
+            the number of tokens each window advances over the previous one
+
+        Returns
+        -------
+        windows: contextWindows
+            the token windows to pass through the model
+
+        reads: list
+            a tuple for each window of the positions in the window whose logits are read
+            and the tokens whose probabilities are taken from them
+        """
+        if len(nextWord) == 0:
+            # a text of a single token has nothing to score
+            return contextWindows(np.zeros(0, dtype=np.int64), [], []), []
+
+        tokens = list(seqs[0][:1]) + list(nextWord)
+        window_length = max(len(seq) for seq in seqs) + 1
+
+        if stride < 1 or stride > window_length - 1:
+            raise ValueError('The stride must be between 1 and the context length plus one')
+
+        starts = []
+        ends = []
+        reads = []
+        scored = 0
+        begin = 0
+        while scored < len(nextWord):
+            end = min(begin + window_length, len(tokens))
+            positions = range(scored + 1, end)
+            starts.append(begin)
+            ends.append(end)
+            reads.append(([position - 1 - begin for position in positions],
+                          [tokens[position] for position in positions]))
+            scored = end - 1
+            begin += stride
+
+        return contextWindows(np.array(tokens, dtype=np.int64), starts, ends), reads
+
+    def _incremental_log_probability(self, seqs, nextWord, device):
+        """Scores the token stream one token at a time reusing the cached key/value states
+
+        Parameters
+        ----------
+        seqs : 2D list
+            the sequences created by sequence_processor.text_to_sequences
+
+        nextWord: list
+            the token that follows each sequence
+
+        device: torch.device
+            the device the model is on
+
+        Returns
+        -------
+        scores: dict
+            the natural log probability of every token after the first and the requested statistics
+
+        Notes
+        -----
+        The cache is trimmed to the context length after every token so the model attends to
+        the same number of tokens as the sequences from text_to_sequences. While the text fits
+        in the context the probabilities are the same as scoring the sequences. After that the
+        cached states of the older tokens were computed with their own preceding context, so
+        the results differ slightly from re-encoding each sequence from scratch. The positions
+        continue to count up and when they reach the model's n_positions the cache is rebuilt
+        from the last context tokens starting at position 0
+        """
+        if self.modelType not in ('gpt2', 'gpt2-xl', 'ctrl'):
+            raise ValueError('Incremental scoring is only supported for the gpt2, gpt2-xl and ctrl models')
+
+        tokens = list(seqs[0][:1]) + list(nextWord)
+        keep = max(len(seq) for seq in seqs) - 1
+        n_positions = self.model.config.n_positions
+
+        scores = []
+        past = None
+        position = 0
+
+        with torch.no_grad():
+            for i in range(len(nextWord)):
+                if position >= n_positions:
+                    # rebuild the cache with fresh positions from the last context tokens
+                    window = torch.tensor(tokens[i - keep:i]).unsqueeze(0).to(device)
+                    past = self.model(window)[1] if keep > 0 else None
+                    position = keep
+
+                input_ids = torch.tensor([[tokens[i]]], device=device)
+                position_ids = torch.tensor([[position]], device=device)
+                output = self.model(input_ids, past=past, position_ids=position_ids)
+                position += 1
+
+                past = [layer[:, :, :, -keep:, :] for layer in output[1]] if keep > 0 else None
+                scores.append(self._read_scores(output[0][0, -1:], [tokens[i + 1]]))
+
+        return self._join_scores(scores)
+
+    def _recurrent_log_probability(self, seqs, nextWord, segment_length, device):
+        """Streams the token stream through Transformer-XL in segments carrying the memory forward
+
+        Parameters
+        ----------
+        seqs : 2D list
+            the sequences created by sequence_processor.text_to_sequences
+
+        nextWord: list
+            the token that follows each sequence
+
+        segment_length: int
+            the number of tokens passed through the model in each call
+
+        device: torch.device
+            the device the model is on
+
+        Returns
+        -------
+        scores: dict
+            the natural log probability of every token after the first and the requested statistics
+
+        Notes
+        -----
+        The cost of a segment depends only on segment_length and the memory length of the
+        model, so the whole text is scored in time linear in its length. The length of the
+        memory is set by the model configuration and can be changed with model.reset_length
+        """
+        if self.modelType != 'txl':
+            raise ValueError('Recurrent scoring is only supported for the txl model')
+
+        if segment_length < 1:
+            raise ValueError('The segment length must be at least 1')
+
+        tokens = list(seqs[0][:1]) + list(nextWord)
+
+        scores = []
+        mems = None
+
+        with torch.no_grad():
+            for start in range(0, len(nextWord), segment_length):
+                segment = tokens[start:start + segment_length]
+                input_ids = torch.tensor(segment).unsqueeze(0).to(device)
+                output = self.model(input_ids, mems=mems)
+                mems = output[1]
+
+                # the last token of a segment predicts the first token of the next one
+                targets = tokens[start + 1:start + len(segment) + 1]
+                scores.append(self._read_scores(output[0][0, :len(targets)], targets))
+
+        return self._join_scores(scores)
+
+    def _score_windows(self, windows, reads, device, max_tokens=None, workers=None, threads_per_worker=None,
+                       checkpoint=None):
+        """Runs each window through the model once and reads the log probability of the
+        requested tokens from the logits at the requested positions
+
+        Parameters
+        ----------
+        windows: contextWindows or 2D list
+            the token windows to pass through the model
+
+        reads: list
+            a tuple for each window of the positions to read and the target tokens
+
+        device: torch.device
+            the device the model is on
+
+        max_tokens: int, optional
+            the token budget of a padded batch, windows are passed one at a time when not set
+            except by the layer_streamed backend, which uses STREAMED_MAX_TOKENS
+
+        workers: int, optional
+            the number of CPU processes the batches are split across
+
+        threads_per_worker: int, optional
+            the number of intra-op threads of each worker process
+
+        checkpoint: str, optional
+            the file the scores of each finished batch are appended to and read back from
+
+        Returns
+        -------
+        scores: dict
+            the natural log probability of every target token in the order they were requested
+            and the requested statistics
+        """
+        if max_tokens is None and self.backend == 'layer_streamed':
+            max_tokens = STREAMED_MAX_TOKENS
+
+        batches = self._length_buckets(windows, max_tokens)
+        tasks = [(self._select_windows(windows, batch), [reads[i] for i in batch], max_tokens is not None)
+                 for batch in batches]
+
+        if checkpoint is not None:
+            if workers is not None and workers > 1:
+                raise ValueError('Checkpointed scoring cannot be combined with workers')
+            fingerprint = self._checkpoint_fingerprint(windows, reads, batches, max_tokens)
+            batch_scores = self._score_batches_with_checkpoint(tasks, device, checkpoint, fingerprint)
+        elif workers is not None and workers > 1:
+            if device.type != 'cpu':
+                raise ValueError('Multi-process scoring only runs on the CPU')
+            batch_scores = self._score_batches_in_workers(tasks, workers, threads_per_worker)
+        else:
+            batch_scores = [self._score_batch(*task, device=device) for task in tasks]
+
+        window_scores = [None] * len(windows)
+        for batch, scores in zip(batches, batch_scores):
+            for i, score in zip(batch, scores):
+                window_scores[i] = score
+
+        return self._join_scores(window_scores)
+
+    def _score_batch(self, windows, reads, padded, device=torch.device('cpu')):
+        """Passes one batch of windows through the model and returns the scores of each window"""
+
+        input_ids, attention_mask = self._pad_batch(windows)
+        if padded:
+            attention_mask = attention_mask.to(device)
+        else:
+            # a batch of one window has no padding to mask
+            attention_mask = None
+        input_ids = input_ids.to(device)
+
+        if self.backend == 'layer_streamed':
+            # only the logits of the positions read are computed, not those of the whole batch
+            with torch.no_grad():
+                predictions = self.model(input_ids, attention_mask, [positions for positions, _ in reads])[0]
+
+            return [self._read_scores(logits, targets) for logits, (_, targets) in zip(predictions, reads)]
+
+        with torch.no_grad():
+            predictions = self._forward(input_ids, attention_mask)
+
+        return [self._read_scores(predictions[row, positions], targets)
+                for row, (positions, targets) in enumerate(reads)]
+
+    def _score_batches_with_checkpoint(self, tasks, device, checkpoint, fingerprint):
+        """Scores the batches, reading the finished ones from the checkpoint file and appending the others
+
+        Notes
+        -----
+        The file starts with a line holding a fingerprint of the job, the model and the batches,
+        followed by a record for each finished batch: its index and the scores of its windows as
+        they came out of the model, before any conversion. Scores read back are therefore the
+        same bits as freshly computed ones and a resumed job gives the same result as one that
+        ran without stopping. A record cut short by an interruption is dropped.
+
+        Every record is flushed to the operating system as soon as its batch is scored, so it
+        survives the process being killed, but the file is synced to disk at most once every
+        CHECKPOINT_SYNC_SECONDS and when the job ends. Without max_tokens each window is a batch
+        of its own and syncing every record would cost a disk round trip per window
+        """
+        names = ['log_probability'] + self.statistic_names
+
+        batch_scores = [None] * len(tasks)
+        end = None
+        if os.path.exists(checkpoint) and os.path.getsize(checkpoint) > 0:
+            with open(checkpoint, 'rb') as f:
+                header = json.loads(f.readline().decode('utf-8'))
+                if header != fingerprint:
+                    raise ValueError('The checkpoint ' + checkpoint + ' was written by a different job')
+                end = f.tell()
+                while True:
+                    try:
+                        index = int(np.load(f)[0])
+                        values = [np.load(f) for _ in names]
+                    except (ValueError, EOFError, OSError, IndexError):
+                        break
+                    end = f.tell()
+                    lengths = [len(targets) for _, targets in tasks[index][1]]
+                    splits = [np.split(value, np.cumsum(lengths)[:-1]) for value in values]
+                    batch_scores[index] = [{name: torch.from_numpy(split[window]) for name, split in zip(names, splits)}
+                                           for window in range(len(lengths))]
+
+        with open(checkpoint, 'r+b' if end is not None else 'wb') as f:
+            if end is None:
+                f.write((json.dumps(fingerprint, sort_keys=True) + '\n').encode('utf-8'))
+            else:
+                # drop a record cut short by an interruption
+                f.truncate(end)
+                f.seek(end)
+
+            synced = time.monotonic()
+            for index, task in enumerate(tasks):
+                if batch_scores[index] is not None:
+                    continue
+                batch_scores[index] = self._score_batch(*task, device=device)
+                np.save(f, np.array([index], dtype=np.int64))
+                for name in names:
+                    np.save(f, torch.cat([score[name] for score in batch_scores[index]]).numpy())
+                f.flush()
+                if time.monotonic() - synced >= CHECKPOINT_SYNC_SECONDS:
+                    os.fsync(f.fileno())
+                    synced = time.monotonic()
+
+            os.fsync(f.fileno())
+
+        return batch_scores
+
+    def _checkpoint_fingerprint(self, windows, reads, batches, max_tokens):
+        """Describes a scoring job so that a checkpoint is only resumed by the same job
+
+        The windows, reads and batches are hashed as the bytes of int64 arrays, so a text held
+        in contextWindows is hashed without building a list per window
+        """
+        if isinstance(windows, contextWindows):
+            tokens, starts, ends = windows.tokens, windows.starts, windows.ends
+        else:
+            tokens = [token for window in windows for token in window]
+            ends = np.cumsum([len(window) for window in windows])
+            starts = ends - [len(window) for window in windows]
+
+        arrays = [tokens, starts, ends,
+                  [len(positions) for positions, _ in reads],
+                  [position for positions, _ in reads for position in positions],
+                  [target for _, targets in reads for target in targets],
+                  [len(batch) for batch in batches], [i for batch in batches for i in batch]]
+
+        windows_hash = hashlib.sha256()
+        for array in arrays:
+            array = np.ascontiguousarray(array, dtype=np.int64)
+            # the length separates the arrays, so the boundary between two of them is part of the hash
+            windows_hash.update(np.int64(len(array)).tobytes())
+            windows_hash.update(array.tobytes())
+
+        return {'model': self.modelType, 'quantize': self.quantize, 'backend': self.backend,
+                'max_tokens': max_tokens, 'statistics': self.statistic_names, 'top_k': self.top_k,
+                'torch': torch.__version__, 'transformers': transformers.__version__,
+                'batches': windows_hash.hexdigest()}
+
+    def _score_batches_in_workers(self, tasks, workers, threads_per_worker=None):
+        """Scores the batches in a pool of worker processes sharing the model weights
+
+        Notes
+        -----
+        The parameters are moved to shared memory once so every worker reads the same copy of
+        the weights. Workers are spawned rather than forked, as the OpenMP thread pool of the
+        parent process does not survive a fork. The batches keep their serial composition, so
+        each worker does the same arithmetic as a serial run, although a different intra-op
+        thread count can change the order of some floating point reductions in the matmul
+        kernels of some BLAS builds
+        """
+        if threads_per_worker is None:
+            threads_per_worker = max(1, torch.get_num_threads() // workers)
+
+        self.model.share_memory()
+        context = torch.multiprocessing.get_context('spawn')
+        chunksize = max(1, len(tasks) // (workers * 4))
+
+        # the windows of a batch are sent as lists, pickling a view would send the whole token array
+        tasks = [(windows.tolist() if isinstance(windows, contextWindows) else windows, reads, padded)
+                 for windows, reads, padded in tasks]
+
+        with context.Pool(workers, initializer=_initialise_worker, initargs=(self, threads_per_worker)) as pool:
+            return pool.starmap(_score_worker_batch, tasks, chunksize)
+
+    def _device(self):
+        """Returns the device to score on, quantized models only run on the CPU"""
+
+        if torch.cuda.is_available() and not self.quantize:
+            return torch.device("cuda:0")
+
+        return torch.device("cpu")
+
+    def _set_statistics(self, statistics, top_k):
+        """Checks and records the statistics to compute alongside the log probabilities"""
+
+        statistics = list(statistics or [])
+        for name in statistics:
+            if name not in ('entropy', 'rank', 'top_k'):
+                raise ValueError('Unknown statistic ' + str(name) + ', the statistics available are '
+                                 '\'entropy\', \'rank\' and \'top_k\'')
+
+        self.statistic_names = statistics
+        self.top_k = top_k
+
+    def _read_scores(self, logits, targets):
+        """Computes the log probability of the targets and the requested statistics from logits
+
+        Parameters
+        ----------
+        logits: tensor
+            the logits of the positions to read, one row per target
+
+        targets: list
+            the token whose log probability is taken from each row
+
+        Returns
+        -------
+        scores: dict
+            a tensor with a value per row for the log probability and each requested statistic
+        """
+        log_probabilities = torch.log_softmax(logits, dim=-1)
+        targets = torch.tensor(targets, device=log_probabilities.device).unsqueeze(1)
+        target_log_probability = log_probabilities.gather(1, targets)
+
+        scores = {'log_probability': target_log_probability.squeeze(1)}
+        if 'entropy' in self.statistic_names:
+            entropy = -(log_probabilities.exp() * log_probabilities).sum(dim=-1)
+            scores['entropy'] = entropy / np.log(2)
+        if 'rank' in self.statistic_names:
+            scores['rank'] = (log_probabilities > target_log_probability).sum(dim=-1) + 1
+        if 'top_k' in self.statistic_names:
+            top_k = min(self.top_k, log_probabilities.shape[-1])
+            scores['top_k'] = log_probabilities.topk(top_k, dim=-1)[0].exp().sum(dim=-1)
+
+        return {name: values.cpu() for name, values in scores.items()}
+
+    def _join_scores(self, scores):
+        """Concatenates a list of score dictionaries into one array per score"""
+
+        names = ['log_probability'] + self.statistic_names
+        if not scores:
+            return {name: np.zeros(0) for name in names}
+
+        return {name: torch.cat([score[name] for score in scores]).double().numpy() for name in names}
+
+    def _forward(self, input_ids, attention_mask=None):
+        """Passes a batch of token windows through the model and returns the logits"""
+
+        if attention_mask is not None and self.modelType == 'txl':
+            # Transformer-XL takes no attention mask, the right padding is never attended
+            # to by the real tokens as the attention is causal
+            attention_mask = None
+
+        if self.backend == 'torchscript':
+            logits = self._traced_forward(input_ids, attention_mask)
+            if logits is not None:
+                return logits
+
+        return self._eager_forward(input_ids, attention_mask)
+
+    def _eager_forward(self, input_ids, attention_mask=None):
+        """Passes a batch of token windows through the eager model and returns the logits"""
+
+        if attention_mask is None:
+            output = self.model(input_ids)
+        else:
+            output = self.model(input_ids, attention_mask=attention_mask)
+
+        return output[0]
+
+    def _traced_forward(self, input_ids, attention_mask=None):
+        """Passes a batch of token windows through the traced graph of the model
+
+        Returns
+        -------
+        logits: tensor
+            the logits of the windows, or None when the model cannot be traced and the eager
+            model has to be used instead
+
+        Notes
+        -----
+        One graph is traced for each device and for batches with and without an attention mask.
+        The graph is saved to trace_directory, when it is set, and loaded from there by later
+        processes. The first batch of every new shape is also passed through the eager model and
+        the graph is only used when both agree, as a trace can hold on to the shapes it was traced
+        with. A saved graph that disagrees is traced again, a fresh graph that disagrees or fails
+        to trace means the eager model is used for that kind of batch from then on
+        """
+        traces = registry.get(('trace', self.modelType, self.quantize), lambda: {'graphs': {}, 'checked': set()})
+        graph_key = (input_ids.device.type, attention_mask is not None)
+        inputs = (input_ids,) if attention_mask is None else (input_ids, attention_mask)
+
+        if graph_key not in traces['graphs']:
+            self._replace_graph(traces, graph_key, self._load_trace(graph_key, inputs))
+        graph = traces['graphs'][graph_key]
+        if graph is None:
+            return None
+
+        shape_key = graph_key + (tuple(input_ids.shape),)
+        if shape_key in traces['checked']:
+            return graph(*inputs)
+
+        expected = self._eager_forward(input_ids, attention_mask)
+        if not self._trace_agrees(graph, inputs, expected):
+            graph = self._trace(graph_key, inputs)
+            self._replace_graph(traces, graph_key, graph)
+            if graph is None or not self._trace_agrees(graph, inputs, expected):
+                warnings.warn('The ' + self.modelType + ' graph does not match the eager model, falling back '
+                              'to eager inference')
+                self._replace_graph(traces, graph_key, None)
+                return expected
+
+        traces['checked'].add(shape_key)
+
+        return expected
+
+    def _replace_graph(self, traces, graph_key, graph):
+        """Stores the graph for graph_key and updates the memory the traces hold in the registry
+
+        Notes
+        -----
+        The shapes checked against the previous graph have to be checked again against the new
+        one. A freshly traced graph shares the weights of the model, a graph loaded from
+        trace_directory holds a copy of them which counts towards the memory budget
+        """
+        traces['graphs'][graph_key] = graph
+        traces['checked'].difference_update([key for key in traces['checked'] if key[:len(graph_key)] == graph_key])
+        registry.resize(('trace', self.modelType, self.quantize),
+                        memory_footprint(traces['graphs'], exclude=self.model))
+
+    def _load_trace(self, graph_key, inputs):
+        """Loads the traced graph for graph_key from trace_directory or traces it"""
+
+        path = self._trace_path(graph_key)
+        if path is not None and os.path.exists(path):
+            try:
+                return torch.jit.load(path, map_location=inputs[0].device)
+            except (RuntimeError, ValueError):
+                pass
+
+        return self._trace(graph_key, inputs)
+
+    def _trace(self, graph_key, inputs):
+        """Traces the model with the example inputs and saves the graph, None when tracing fails"""
+
+        self.model.eval()
+        try:
+            with torch.no_grad(), warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                graph = torch.jit.trace(_logitsOnly(self.model), inputs, check_trace=False)
+        except Exception as error:
+            warnings.warn('Tracing ' + self.modelType + ' failed, falling back to eager inference: ' + str(error))
+            return None
+
+        path = self._trace_path(graph_key)
+        if path is not None:
+            os.makedirs(self.trace_directory, exist_ok=True)
+            temporary_path = path + '.tmp'
+            torch.jit.save(graph, temporary_path)
+            os.replace(temporary_path, path)
+
+        return graph
+
+    def _trace_agrees(self, graph, inputs, expected):
+        """Checks the graph reproduces the eager logits for the inputs"""
+
+        try:
+            with torch.no_grad():
+                actual = graph(*inputs)
+        except Exception:
+            return False
+
+        return actual.shape == expected.shape and torch.allclose(actual, expected, rtol=1e-4, atol=1e-4)
+
+    def _trace_path(self, graph_key):
+        """Returns the file of the traced graph for graph_key, None when graphs are not saved"""
+
+        if self.trace_directory is None:
+            return None
+
+        device, masked = graph_key
+        name = '-'.join([self.modelType, 'int8' if self.quantize else 'fp32', device,
+                         'masked' if masked else 'unmasked', 'torch' + torch.__version__,
+                         'transformers' + transformers.__version__])
+
+        return os.path.join(self.trace_directory, name + '.pt')
+
+    def _select_windows(self, windows, batch):
+        """Returns the windows at the indices of a batch, as views of the same tokens for contextWindows"""
+
+        if isinstance(windows, contextWindows):
+            return windows[batch]
+
+        return [windows[i] for i in batch]
+
+    def _length_buckets(self, windows, max_tokens):
+        """Groups the windows into batches of similar length
+
+        Parameters
+        ----------
+        windows: contextWindows or 2D list
+            the token windows to pass through the model
+
+        max_tokens: int
+            the largest number of tokens, padding included, allowed in a batch. Every
+            window is a batch of its own when max_tokens is None
+
+        Returns
+        -------
+        batches: 2D list
+            lists of window indices, a window longer than max_tokens is put in a batch alone
+        """
+        if max_tokens is None:
+            return [[i] for i in range(len(windows))]
+
+        if isinstance(windows, contextWindows):
+            lengths = windows.lengths.tolist()
+        else:
+            lengths = [len(window) for window in windows]
+
+        batches = []
+        batch = []
+        for i in sorted(range(len(windows)), key=lambda index: lengths[index]):
+            # windows are taken in order of length so the current one sets the padded length
+            if batch and (len(batch) + 1) * lengths[i] > max_tokens:
+                batches.append(batch)
+                batch = []
+            batch.append(i)
+
+        if batch:
+            batches.append(batch)
+
+        return batches
+
+    def _pad_batch(self, windows):
+        """Right pads a batch of windows to a common length
+
+        Returns
+        -------
+        input_ids: tensor
+            the padded token ids of the batch
+
+        attention_mask: tensor
+            ones over the tokens of each window and zeros over the padding
+        """
+        if isinstance(windows, contextWindows):
+            # the rows are gathered from the token array in one copy
+            input_ids, attention_mask = windows.padded()
+            return torch.from_numpy(input_ids.astype(np.int64)), torch.from_numpy(attention_mask.astype(np.int64))
+
+        length = max(len(window) for window in windows)
+        input_ids = torch.zeros((len(windows), length), dtype=torch.long)
+        attention_mask = torch.zeros((len(windows), length), dtype=torch.long)
+
+        for row, window in enumerate(windows):
+            input_ids[row, :len(window)] = torch.tensor(window)
+            attention_mask[row, :len(window)] = 1
+
+        return input_ids, attention_mask
+
+    def decode_tokens(self, token_ids):
+        """Decodes token ids to words with a single lookup in the cached decode table
+
+        Parameters
+        ----------
+        token_ids : list
+            the indexed tokens to decode
+
+        Returns
+        -------
+        words: list
+            the decoded string of each token with the characters added by the tokenizer removed
+
+        .. versionadded:: 0.0.0
+        """
+        decode_table = registry.get(('decode_table', self.modelType), self._load_decode_table)
+
+        return decode_table[np.asarray(token_ids, dtype=np.int64)].tolist()
+
+    def _load_decode_table(self):
+        """Maps the decode table from the token store, building and storing it when it is missing"""
+
+        store = default_store()
+        if store is None:
+            return self._build_decode_table()
+
+        decode_table = store.load_decode_table(self.modelType)
+        if decode_table is None:
+            decode_table = self._build_decode_table()
+            store.store_decode_table(self.modelType, decode_table)
+
+        return decode_table
+
+    def _build_decode_table(self):
+        """Decodes every token in the vocabulary once
+
+        Returns
+        -------
+        decode_table: ndarray
+            the decoded string of each token id with the spaces of the byte-level tokens and
+            the @@ continuation markers removed
+        """
+        tokens = self.tokenizer.convert_ids_to_tokens(list(range(len(self.tokenizer))))
+        words = [self.tokenizer.convert_tokens_to_string([token]) for token in tokens]
+        words = [word.replace('@', '').replace(' ', '') for word in words]
+
+        return np.array(words, dtype=object)
+
     def clean_predicted_words(self, firstTokenWord):
-        """Clean the word list from the decoded text from the language model
-        it removes added charcaters appended by the language model
+        """Adds the first token of the text to the word list from the language model. The
+        characters added by the tokenizer are already removed by the decode table
 
         Parameters
         ----------
@@ -128,91 +1045,532 @@ class languageModel:
         .. versionadded:: 0.0.0
         """
 
-        firstToken = self.tokenizer.decode(firstTokenWord)
+        firstToken = self.decode_tokens([firstTokenWord])[0]
 
         self.word.insert(0, firstToken)
         self.probability.insert(0, 1.00)
-        self.word = [x.strip(' ') for x in self.word]
-        self.word = [x.replace('@', '') for x in self.word]
-        self.word = [x.replace(" ", "") for x in self.word]
+        self.log_probability = np.insert(self.log_probability, 0, 0.0)
 
-    def collaspeSubWords(self, original_word_list):
+        # the first token is treated as certain, as with its probability of one
+        certain = {'entropy': 0.0, 'rank': 1.0, 'top_k': 1.0}
+        self.statistics = {name: np.insert(values, 0, certain[name]) for name, values in self.statistics.items()}
+
+    def collaspeSubWords(self, original_word_list, word_ids=None):
         """Collaspes the word output from the language model so as to be the same as the
             original words passed to the tokenizer. Chain rule is used to calculate the
-            probability of the complete words that are broken into sub-words
+            probability of the complete words that are broken into sub-words, by summing
+            the log probabilities of the sub-words
 
         Parameters
         ----------
         original_word_list : list
             list of the original words beforre the tokenization stage
 
+        word_ids: ndarray, optional
+            the word each token belongs to, sequence_processor.word_ids. When not given it is
+            found by joining the decoded sub-words until they spell each original word
+
         Returns
         -------
         word: list
             A list of decoded words from the text
 
+        log_probability: ndarray
+            The log probaility values of the words computed by the language model
+
         probability: list
             The probaility values of the words computed by the language model
 
+        statistics: dict
+            The statistics of each word, taken from the distribution its first sub-word was
+            predicted from
+
         .. versionadded:: 0.0.0
         """
+        if word_ids is None:
+            word_ids = self._align_sub_words(original_word_list)
 
+        # sum the sub-word log probabilities of each word in one segmented reduction
+        self.log_probability = np.bincount(word_ids, weights=self.log_probability,
+                                           minlength=len(original_word_list))
+        first_sub_word = np.searchsorted(word_ids, np.arange(len(original_word_list)))
+        self.statistics = {name: values[first_sub_word] for name, values in self.statistics.items()}
+        self.probability = np.exp(self.log_probability).tolist()
+        self.word = list(original_word_list)
 
-        self.word = [x.strip(' ') for x in self.word]
-        out_copy = self.word.copy()
-        value_copy = self.probability.copy()
-        out_pos = 0
-        org_pos = 0
-        offset = 0
+    def _align_sub_words(self, original_word_list):
+        """Finds the word each decoded token belongs to by joining the sub-words in order
 
-        # collasped the sub words and compute probability by chain rule
-        for i in original_word_list:
-            if (out_copy[out_pos] == original_word_list[org_pos]):
-                out_pos += 1
-            else:
-                string = out_copy[out_pos]
-                prob = value_copy[out_pos]
-                count = 1
-                while (string != original_word_list[org_pos]):
-                    string += out_copy[out_pos + count]
-                    prob = value_copy[out_pos + count] * prob
-                    count += 1
-
-                self.word.insert(org_pos + offset, string)
-                self.probability.insert(org_pos + offset, prob)
-
-                for j in range(count):
-                    offset += 1
-                    self.word[org_pos + offset] = "GETRIDOFF"
-                    self.probability[org_pos + offset] = "GETRIDOFF"
-                    out_pos += 1
-            org_pos += 1
-
-
-        # Removing those words that are marked and are now redundant
-        true = [None] * len(original_word_list)
-        true_val = [None] * len(original_word_list)
+        Returns
+        -------
+        word_ids: ndarray
+            the position in original_word_list of the word each token belongs to
+        """
+        word_ids = np.zeros(len(self.word), dtype=np.int64)
         position = 0
-        for i in range(len(self.word)):
-            if (self.word[i] != "GETRIDOFF"):
-                true[position] = self.word[i]
-                true_val[position] = self.probability[i]
+        string = ''
+        for i, sub_word in enumerate(self.word):
+            if position >= len(original_word_list):
+                raise ValueError('The decoded tokens do not match the original words')
+            string += sub_word.strip(' ')
+            word_ids[i] = position
+            if string == original_word_list[position]:
                 position += 1
+                string = ''
 
-        self.probability = true_val
-        self.word = true
+        if position != len(original_word_list):
+            raise ValueError('The decoded tokens do not match the original words')
 
+        return word_ids
 
     def computeSurprisal(self):
         """ computed the surprisal of each element in a list
                 surprisal = the negative log probability
         Returns:
         -------
-        Surprisal: list
-            Surprisal values computed from the probability values output by the language model
+        Surprisal: ndarray
+            Surprisal values in bits computed from the log probability values output by the language model
         """
 
-        self.surprisal = self.probability
-        for i in range(len(self.probability) - 1):
-            sur = math.log(self.probability[i], 2) * -1
-            self.surprisal[i] = sur
+        self.surprisal = -self.log_probability / np.log(2)
+
+
+def word_surprisal(model_type, clean_words, context=50, quantize=False, tokenizer_backend='slow', **scoring_options):
+    """ Calculates the surprisal of each word with a language model
+
+    Parameters
+    ----------
+    model_type : str
+        language model code to select the model to calculate surprisal
+
+    clean_words: list
+        list of words already cleaned by preprocessing_text.clean_text
+
+    context: int or list
+        the amount of words to be consided as context for caculating surprisal. A list of
+        context lengths is scored in a single pass with languageModel.context_sweep
+
+    quantize: bool, optional
+        score with the int8 quantized model, see languageModel.quantizedModelLoader
+
+    tokenizer_backend: str, optional
+        'fast' tokenizes with the compiled tokenizer, which gives the same tokens
+
+    scoring_options:
+        keyword arguments passed on to languageModel.word_probability, eg stride, max_tokens or
+        statistics
+
+    Returns
+    -------
+    covariates : DataFrame
+        the 'Surprisal' in bits of each word and a column for each of the requested statistics
+        ('Entropy', 'Rank' and 'Top_k'). When context is a list every column name is suffixed
+        with the context length, eg 'Surprisal_50'
+
+    .. versionadded:: 0.0.0
+    """
+    text = ' '.join(clean_words)
+
+    # Sequence for Language models
+    sp = sequence_processor(model_type, text, tokenizer_backend)
+    sp.tokenizeWords()
+
+    model = languageModel(model_type, quantize)
+
+    if isinstance(context, (list, tuple)):
+        model.context_sweep(sp.indexed_tokens, context, **scoring_options)
+        log_probabilities = model.log_probability
+        statistics = model.statistics
+        words = model.word
+
+        covariates = pd.DataFrame()
+        for i, length in enumerate(context):
+            model.log_probability = log_probabilities[i]
+            model.statistics = {name: values[i] for name, values in statistics.items()}
+            model.probability = np.exp(log_probabilities[i]).tolist()
+            model.word = list(words)
+            for name, values in _collapsed_covariates(model, sp, clean_words).items():
+                covariates[name + '_' + str(length)] = values
+
+        return covariates
+
+    # Language model computation of surprisal
+    sp.text_to_sequences(context)
+    model.word_probability(sp.indexed_sequences, sp.indexed_nextWord, **scoring_options)
+
+    return pd.DataFrame(data=_collapsed_covariates(model, sp, clean_words))
+
+
+def batch_word_surprisal(model_type, word_lists, context=50, quantize=False, tokenizer_backend='slow',
+                         **scoring_options):
+    """ Calculates the surprisal of the words of several texts with shared forward passes
+
+    Parameters
+    ----------
+    model_type : str
+        language model code to select the model to calculate surprisal
+
+    word_lists: list
+        a list of words already cleaned by preprocessing_text.clean_text for each text
+
+    context: int
+        the amount of words to be consided as context for caculating surprisal
+
+    quantize: bool, optional
+        score with the int8 quantized model
+
+    tokenizer_backend: str, optional
+        'fast' tokenizes the words of all the texts in one batch with the compiled tokenizer
+
+    scoring_options:
+        keyword arguments passed on to languageModel.word_probability, the windows of the texts
+        are pooled so only max_tokens, statistics, top_k, workers and threads_per_worker apply
+
+    Returns
+    -------
+    covariates : list
+        a DataFrame for each text with the same columns as word_surprisal
+
+    Notes
+    -----
+    The windows of all the texts are scored in one word_probability call, so with max_tokens
+    windows of different texts share padded batches. The windows never cross from one text
+    into another
+
+    .. versionadded:: 0.0.0
+    """
+    for option in ('stride', 'incremental', 'segment_length'):
+        if scoring_options.get(option):
+            raise ValueError(option + ' scores a text as one stream and cannot be used to score texts together')
+
+    model = languageModel(model_type, quantize)
+
+    processors = tokenize_texts(model_type, [' '.join(clean_words) for clean_words in word_lists], tokenizer_backend)
+    next_words = []
+    for sp in processors:
+        sp.text_to_sequences(context)
+        next_words.extend(sp.indexed_nextWord)
+    sequences = contextWindows.concatenate([sp.indexed_sequences for sp in processors])
+
+    model.word_probability(sequences, next_words, **scoring_options)
+    log_probabilities = model.log_probability
+    statistics = model.statistics
+    words = model.word
+
+    covariates = []
+    start = 0
+    for sp, clean_words in zip(processors, word_lists):
+        stop = start + len(sp.indexed_nextWord)
+        model.log_probability = log_probabilities[start:stop]
+        model.statistics = {name: values[start:stop] for name, values in statistics.items()}
+        model.probability = np.exp(model.log_probability).tolist()
+        model.word = list(words[start:stop])
+        covariates.append(pd.DataFrame(data=_collapsed_covariates(model, sp, clean_words)))
+        start = stop
+
+    return covariates
+
+
+def stream_word_surprisal(model_type, words, context=50, chunk_words=512, **scoring_options):
+    """ Calculates the surprisal of a stream of words in bounded memory
+
+    Parameters
+    ----------
+    model_type : str
+        language model code to select the model to calculate surprisal
+
+    words: iterable or str
+        the words already cleaned by preprocessing_text.clean_text, or the path of a text file
+        whose words are cleaned as they are read
+
+    context: int
+        the amount of tokens to be consided as context for caculating surprisal
+
+    chunk_words: int
+        the number of words tokenized and scored together
+
+    scoring_options:
+        keyword arguments passed on to languageModel.word_probability, eg max_tokens. stride,
+        incremental and segment_length rebuild the token stream from the windows of a chunk,
+        which would drop the context carried over from the previous chunk, so they raise a
+        ValueError
+
+    Yields
+    ------
+    record : tuple
+        each word and its surprisal in bits
+
+    Notes
+    -----
+    The words are read chunk_words at a time and only the last context + 1 tokens of the
+    previous chunks are kept as the context of the next one, so the memory does not grow with
+    the length of the stream. The surprisal values are the same as word_surprisal gives for the
+    whole text
+
+    .. versionadded:: 0.0.0
+    """
+    # checked here rather than in the generator, so the error is raised by the call itself
+    for option in ('stride', 'incremental', 'segment_length'):
+        if scoring_options.get(option):
+            raise ValueError(option + ' scores a text as one stream and cannot be used to score it in chunks')
+
+    return _stream_word_surprisal(model_type, words, context, chunk_words, scoring_options)
+
+
+def _stream_word_surprisal(model_type, words, context, chunk_words, scoring_options):
+    """Yields the surprisal of each word of the stream, see stream_word_surprisal"""
+
+    if isinstance(words, str):
+        words = _read_clean_words(words, chunk_words)
+
+    model = languageModel(model_type)
+
+    history = []
+    position = 0
+    word_position = 0
+    for chunk in _chunks(words, chunk_words):
+        sp = sequence_processor(model_type, ' '.join(chunk))
+        sp.tokenizeWords(first_word_index=word_position)
+
+        tokens = history + sp.indexed_tokens
+        # the position in the stream of the first token in tokens
+        base = position - len(history)
+
+        # the window of token i holds the context tokens before it
+        ends = np.arange(max(len(history), 1 - base), len(tokens))
+        starts = np.maximum(0, base + ends - 1 - context) - base
+        windows = contextWindows(np.array(tokens, dtype=np.int64), starts, ends)
+        targets = tokens[ends[0]:] if len(ends) else []
+
+        model.word_probability(windows, targets, **scoring_options)
+        log_probability = model.log_probability
+        if position == 0 and sp.indexed_tokens:
+            # the first token of the stream is treated as certain, as in clean_predicted_words
+            log_probability = np.insert(log_probability, 0, 0.0)
+
+        word_log_probability = np.bincount(sp.word_ids, weights=log_probability, minlength=len(chunk))
+        for word, surprisal in zip(chunk, -word_log_probability / np.log(2)):
+            yield word, surprisal
+
+        position += len(sp.indexed_tokens)
+        word_position += len(chunk)
+        history = tokens[-(context + 1):]
+
+
+def _chunks(words, chunk_words):
+    """Groups an iterable of words into lists of chunk_words words"""
+
+    chunk = []
+    for word in words:
+        chunk.append(word)
+        if len(chunk) == chunk_words:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def _read_clean_words(path, chunk_words):
+    """Reads the words of a text file lazily and cleans them with preprocessing_text.clean_text"""
+
+    text_processor = preprocessing_text()
+    with open(path) as f:
+        raw_words = (word for line in f for word in line.split())
+        for chunk in _chunks(raw_words, chunk_words):
+            yield from text_processor.clean_text(chunk)
+
+
+def release_model(model_type):
+    """ Drops the shared model and traced graphs of model_type from the model registry
+
+    Parameters
+    ----------
+    model_type : str
+        language model code of the model to release
+
+    Notes
+    -----
+    The tokenizer and decode table stay registered as they are small. The model is freed once
+    no languageModel holds on to it any more
+
+    .. versionadded:: 0.0.0
+    """
+    registry.release_matching(lambda key: key[0] in ('model', 'trace') and key[1] == model_type)
+
+
+def _collapsed_covariates(model, sp, clean_words):
+    """Turns the token probabilities and statistics held by model into covariates of each word"""
+
+    model.clean_predicted_words(sp.indexed_tokens[0])
+    model.collaspeSubWords(clean_words, sp.word_ids)
+    model.computeSurprisal()
+
+    covariates = {'Surprisal': model.surprisal}
+    for name, values in model.statistics.items():
+        covariates[name.capitalize()] = values
+
+    return covariates
+
+
+# a short passage of ordinary prose used to compare the surprisal of two versions of a model
+REFERENCE_TEXT = ('when the train finally pulled into the station it was already dark and the small town seemed '
+                  'to have gone to sleep the only light came from a cafe across the square where an old man was '
+                  'stacking chairs she carried her bag over the cobbles and asked him whether there was a room '
+                  'anywhere for the night he looked at her for a long moment and then pointed up the hill to a '
+                  'house with a blue door where his sister sometimes took in travellers')
+
+
+def quantization_report(model_type, clean_words=None, context=50, **scoring_options):
+    """ Measures how far the surprisal of the int8 quantized model is from the fp32 model
+
+    Parameters
+    ----------
+    model_type : str
+        language model code to select the model to calculate surprisal
+
+    clean_words: list, optional
+        the reference words to score, REFERENCE_TEXT is used when not given
+
+    context: int
+        the amount of words to be consided as context for caculating surprisal
+
+    scoring_options:
+        keyword arguments passed on to languageModel.word_probability
+
+    Returns
+    -------
+    report : dict
+        the mean and maximum absolute surprisal difference in bits, the correlation between the
+        two surprisal values and the scoring time in seconds and parameter memory in bytes of
+        each model
+
+    .. versionadded:: 0.0.0
+    """
+    if clean_words is None:
+        clean_words = REFERENCE_TEXT.split(' ')
+
+    surprisal = {}
+    seconds = {}
+    memory = {}
+    for quantize in (False, True):
+        model = languageModel(model_type, quantize)
+        memory[quantize] = memory_footprint(model.model)
+
+        start = time.perf_counter()
+        surprisal[quantize] = word_surprisal(model_type, clean_words, context, quantize,
+                                             **scoring_options)['Surprisal'].values
+        seconds[quantize] = time.perf_counter() - start
+
+    deviation = np.abs(surprisal[True] - surprisal[False])
+
+    return {'mean_deviation': float(deviation.mean()), 'max_deviation': float(deviation.max()),
+            'correlation': float(np.corrcoef(surprisal[True], surprisal[False])[0, 1]),
+            'fp32_seconds': seconds[False], 'int8_seconds': seconds[True],
+            'fp32_bytes': memory[False], 'int8_bytes': memory[True]}
+
+
+class _logitsOnly(torch.nn.Module):
+    """Wraps a language model so that tracing it gives a graph returning only the logits"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask=None):
+        if attention_mask is None:
+            return self.model(input_ids)[0]
+
+        return self.model(input_ids, attention_mask=attention_mask)[0]
+
+
+def benchmark_backends(model_type, clean_words=None, context=10, repeats=3, trace_directory=None,
+                       **scoring_options):
+    """ Times word_probability with the eager and the torchscript backends
+
+    Parameters
+    ----------
+    model_type : str
+        language model code to select the model to benchmark
+
+    clean_words: list, optional
+        the words to score, REFERENCE_TEXT is used when not given
+
+    context: int
+        the amount of words to be consided as context
+
+    repeats: int
+        the number of timed runs of each backend, the fastest run is reported
+
+    trace_directory: str, optional
+        the folder the traced graphs are saved to
+
+    scoring_options:
+        keyword arguments passed on to languageModel.word_probability
+
+    Returns
+    -------
+    report : dict
+        the fastest run in seconds of each backend, the largest difference between their log
+        probabilities and whether the torchscript backend fell back to the eager model
+
+    .. versionadded:: 0.0.0
+    """
+    if clean_words is None:
+        clean_words = REFERENCE_TEXT.split(' ')
+
+    sp = sequence_processor(model_type, ' '.join(clean_words))
+    sp.tokenizeWords()
+    sp.text_to_sequences(context)
+
+    seconds = {}
+    log_probability = {}
+    for backend in ('eager', 'torchscript'):
+        model = languageModel(model_type, backend=backend, trace_directory=trace_directory)
+        # the first run traces the graphs and checks every shape against the eager model
+        model.word_probability(sp.indexed_sequences, sp.indexed_nextWord, **scoring_options)
+
+        runs = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model.word_probability(sp.indexed_sequences, sp.indexed_nextWord, **scoring_options)
+            runs.append(time.perf_counter() - start)
+        seconds[backend] = min(runs)
+        log_probability[backend] = model.log_probability
+
+    traces = registry.get(('trace', model_type, False), lambda: {'graphs': {}, 'checked': set()})
+
+    return {'eager_seconds': seconds['eager'], 'torchscript_seconds': seconds['torchscript'],
+            'max_deviation': float(np.abs(log_probability['eager'] - log_probability['torchscript']).max()),
+            'fallback': any(graph is None for graph in traces['graphs'].values())}
+
+
+_worker_model = None
+
+
+def _initialise_worker(model, threads_per_worker):
+    """Keeps the language model of a scoring worker process and pins its intra-op thread count"""
+
+    global _worker_model
+    torch.set_num_threads(threads_per_worker)
+    _worker_model = model
+
+
+def _score_worker_batch(windows, reads, padded):
+    """Scores a batch of windows with the language model of the worker process"""
+
+    return _worker_model._score_batch(windows, reads, padded)
+
+
+def _conv1d_to_linear(module):
+    """Replaces the GPT-2 Conv1D layers in module with nn.Linear layers computing the same function"""
+
+    for name, child in module.named_children():
+        if isinstance(child, Conv1D):
+            # Conv1D stores its weight as (in_features, out_features)
+            linear = torch.nn.Linear(child.weight.shape[0], child.weight.shape[1])
+            linear.weight = torch.nn.Parameter(child.weight.detach().t().contiguous())
+            linear.bias = child.bias
+            setattr(module, name, linear)
+        else:
+            _conv1d_to_linear(child)
@@ -0,0 +1,199 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import torch
+from transformers import GPT2Config, CTRLConfig
+from transformers.modeling_ctrl import EncoderLayer, positional_encoding
+from transformers.modeling_gpt2 import Block
+
+# the models whose transformer blocks can be streamed and the names of their final layer norm
+STREAMED_MODELS = {'gpt2': 'ln_f', 'gpt2-xl': 'ln_f', 'ctrl': 'layernorm'}
+
+# the token budget of a padded batch when none is given, every block is read once per batch. Only
+# the positions that are read are projected onto the vocabulary, so the budget bounds the activations
+STREAMED_MAX_TOKENS = 4096
+
+
+class layerStreamedModel(torch.nn.Module):
+
+    def __init__(self, directory, vocab_chunk=8192):
+        super().__init__()
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            manifest = json.load(f)
+
+        self.directory = directory
+        self.modelType = manifest['model_type']
+        self.vocab_chunk = vocab_chunk
+
+        if self.modelType == 'ctrl':
+            self.config = CTRLConfig.from_dict(manifest['config'])
+            self.layer = EncoderLayer(self.config.n_embd, self.config.n_head, self.config.dff,
+                                      self.config.resid_pdrop)
+        else:
+            self.config = GPT2Config.from_dict(manifest['config'])
+            self.layer = Block(self.config.n_ctx, self.config, scale=True)
+
+        # dropout is never used for scoring
+        self.eval()
+
+    def forward(self, input_ids, attention_mask=None, positions=None):
+        """Passes a batch of token windows through the model one transformer block at a time
+
+        Parameters
+        ----------
+        input_ids: tensor
+            the token windows, one row per window
+
+        attention_mask: tensor, optional
+            1 for the real tokens and 0 for the padding of each window
+
+        positions: list, optional
+            the positions of each row whose logits are needed. When given only those hidden
+            states are projected onto the vocabulary
+
+        Returns
+        -------
+        output: tuple
+            the logits of every position, in a tuple like the output of the transformers models.
+            When positions is given the tuple holds a list with a tensor for each row, of one
+            row of logits per position
+
+        Notes
+        -----
+        The weights of each block are read from their memory-mapped files into the single block
+        module just before it is used, so only one block is held in memory next to the hidden
+        states of the batch. The embedding rows of the tokens are read from the embedding file
+        and the logits are computed against the embedding matrix vocab_chunk rows at a time
+
+        .. versionadded:: 0.0.0
+        """
+        device = input_ids.device
+        token_ids = input_ids.cpu().numpy()
+        token_positions = np.arange(input_ids.shape[1])
+
+        if self.modelType == 'ctrl':
+            embedding_name = 'w.weight'
+            hidden_states = self._rows(embedding_name, token_ids, device) * np.sqrt(self.config.n_embd)
+            hidden_states = hidden_states + positional_encoding(len(token_positions), self.config.n_embd,
+                                                                torch.float).to(device)
+            causal_mask = torch.triu(torch.ones(len(token_positions), len(token_positions)), 1).to(device)
+        else:
+            embedding_name = 'wte.weight'
+            hidden_states = (self._rows(embedding_name, token_ids, device) +
+                             self._rows('wpe.weight', token_positions, device))
+
+        if attention_mask is not None:
+            attention_mask = attention_mask.view(attention_mask.shape[0], 1, 1, -1).to(hidden_states.dtype)
+            attention_mask = (1.0 - attention_mask) * -10000.0
+
+        with torch.no_grad():
+            for i in range(self.config.n_layer):
+                self._load_layer(i, device)
+                if self.modelType == 'ctrl':
+                    hidden_states = self.layer(hidden_states, causal_mask, attention_mask=attention_mask)[0]
+                else:
+                    hidden_states = self.layer(hidden_states, attention_mask=attention_mask)[0]
+
+            if positions is not None:
+                # a (rows, length, vocabulary) logits tensor would outgrow a block for large vocabularies
+                counts = [len(row_positions) for row_positions in positions]
+                hidden_states = torch.cat([hidden_states[row, list(row_positions)]
+                                           for row, row_positions in enumerate(positions)])
+
+            norm_name = STREAMED_MODELS[self.modelType]
+            hidden_states = torch.nn.functional.layer_norm(
+                hidden_states, (self.config.n_embd,), self._tensor(norm_name + '.weight', device),
+                self._tensor(norm_name + '.bias', device), self.config.layer_norm_epsilon)
+
+            logits = self._logits(hidden_states, embedding_name, device)
+
+        if positions is not None:
+            return (list(torch.split(logits, counts)),)
+
+        return (logits,)
+
+    def _logits(self, hidden_states, embedding_name, device):
+        """Multiplies the hidden states with the tied embedding matrix a chunk of the vocabulary at a time"""
+
+        embedding = self._weights(embedding_name)
+        bias = self._weights('lm_head.bias') if self.modelType == 'ctrl' else None
+
+        logits = torch.empty(hidden_states.shape[:-1] + (embedding.shape[0],), device=device)
+        for start in range(0, embedding.shape[0], self.vocab_chunk):
+            stop = min(start + self.vocab_chunk, embedding.shape[0])
+            logits[..., start:stop] = hidden_states @ torch.from_numpy(np.array(embedding[start:stop])).to(device).t()
+            if bias is not None:
+                logits[..., start:stop] += torch.from_numpy(np.array(bias[start:stop])).to(device)
+
+        return logits
+
+    def _load_layer(self, i, device):
+        """Replaces the parameters of the block module with those of block i"""
+
+        for name, parameter in self.layer.named_parameters():
+            parameter.data = self._tensor('h.' + str(i) + '.' + name, device)
+
+    def _rows(self, name, indices, device):
+        """Reads the rows of a weight matrix at indices from its memory-mapped file"""
+
+        return torch.from_numpy(np.array(self._weights(name)[indices])).to(device)
+
+    def _tensor(self, name, device):
+        """Reads a whole weight from its memory-mapped file"""
+
+        return torch.from_numpy(np.array(self._weights(name))).to(device)
+
+    def _weights(self, name):
+        return np.load(os.path.join(self.directory, name + '.npy'), mmap_mode='r')
+
+
+def export_layers(model, model_type, directory):
+    """ Writes the weights of a language model to one .npy file per weight for layer streaming
+
+    Parameters
+    ----------
+    model: GPT2LMHeadModel or CTRLLMHeadModel
+        the language model to export
+
+    model_type : str
+        language model code of the model, one of 'gpt2', 'gpt2-xl' and 'ctrl'
+
+    directory: str
+        the folder the weights and the manifest are written to
+
+    Notes
+    -----
+    The whole model has to fit in memory once to be exported, eg on a larger machine, after
+    which layerStreamedModel reads it back one block at a time
+
+    .. versionadded:: 0.0.0
+    """
+    if model_type not in STREAMED_MODELS:
+        raise ValueError('Layer streaming is only available for ' + ', '.join(STREAMED_MODELS))
+
+    os.makedirs(directory, exist_ok=True)
+
+    weights = dict(model.transformer.named_parameters())
+    if model_type == 'ctrl':
+        weights['lm_head.bias'] = model.lm_head.bias
+
+    for name, weight in weights.items():
+        np.save(os.path.join(directory, name + '.npy'), weight.detach().cpu().numpy().astype(np.float32))
+
+    # the manifest is written last so that an interrupted export is not mistaken for a complete one
+    with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+        json.dump({'model_type': model_type, 'config': model.config.to_dict()}, f)
+
+
+if __name__ == '__main__':
+
+    from src.features.language_modelling import languageModel
+
+    parser = argparse.ArgumentParser(description='Export a language model for layer streamed inference')
+    parser.add_argument('model', choices=sorted(STREAMED_MODELS), help='The language model code to export')
+    parser.add_argument('directory', help='The folder the weights are written to')
+    args = parser.parse_args()
+
+    export_layers(languageModel(args.model).model, args.model, args.directory)
@@ -0,0 +1,351 @@
+import argparse
+import http.client
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+from src.features.language_modelling import languageModel, batch_word_surprisal
+
+
+class microBatcher:
+
+    def __init__(self, max_delay=0.01, max_words=20000, max_tokens=4096):
+        self.max_delay = max_delay
+        self.max_words = max_words
+        self.max_tokens = max_tokens
+        self.batches = 0
+        self.requests = 0
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def submit(self, model_type, clean_words, context=50, scoring_options=None):
+        """Queues a text for scoring and returns a future of its covariates
+
+        Parameters
+        ----------
+        model_type : str
+            language model code to select the model to calculate surprisal
+
+        clean_words: list
+            list of words already cleaned by preprocessing_text.clean_text
+
+        context: int
+            the amount of words to be consided as context for caculating surprisal
+
+        scoring_options: dict, optional
+            keyword arguments passed on to batch_word_surprisal
+
+        Returns
+        -------
+        future: Future
+            resolves to the DataFrame of covariates of the text, or to the error of a request
+            that cannot be scored
+
+        .. versionadded:: 0.0.0
+        """
+        future = Future()
+        try:
+            request = (model_type, list(clean_words), context, scoring_options or {}, future)
+            self._check_request(*request[:4])
+        except Exception as error:
+            # a malformed request fails on its own and never reaches the batching thread
+            future.set_exception(error)
+            return future
+
+        self._queue.put(request)
+
+        return future
+
+    def _check_request(self, model_type, clean_words, context, scoring_options):
+        """Raises the error of a request that cannot be grouped with the others"""
+
+        if not isinstance(model_type, str):
+            raise TypeError('The model type must be a string')
+
+        if isinstance(context, bool) or not isinstance(context, int) or context < 0:
+            raise ValueError('The context must be a non-negative integer, got ' + repr(context))
+
+        if not isinstance(scoring_options, dict):
+            raise TypeError('The scoring options must be a dictionary')
+
+        # the options are part of the grouping key, so they must serialise
+        json.dumps(scoring_options, sort_keys=True)
+
+    def start(self):
+        """Starts the batching thread"""
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stops the batching thread once the requests queued so far are scored"""
+
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+
+            batch = [request]
+            words = len(request[1])
+            deadline = time.perf_counter() + self.max_delay
+            stopping = False
+
+            # collect the requests that arrive within the latency budget
+            while words < self.max_words:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                batch.append(request)
+                words += len(request[1])
+
+            try:
+                self._score(batch)
+            except Exception as error:
+                # the thread keeps serving, only the requests of this batch fail
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+            if stopping:
+                return
+
+    def _score(self, batch):
+        """Scores the requests of a batch, one shared word_probability call per model and settings"""
+
+        groups = {}
+        for model_type, clean_words, context, scoring_options, future in batch:
+            try:
+                key = (model_type, context, json.dumps(scoring_options, sort_keys=True))
+                groups.setdefault(key, []).append((clean_words, future))
+            except Exception as error:
+                future.set_exception(error)
+
+        for (model_type, context, scoring_options), requests in groups.items():
+            scoring_options = json.loads(scoring_options)
+            scoring_options.setdefault('max_tokens', self.max_tokens)
+            try:
+                covariates = batch_word_surprisal(model_type, [words for words, _ in requests], context,
+                                                  **scoring_options)
+            except Exception as error:
+                for _, future in requests:
+                    future.set_exception(error)
+                continue
+
+            # counted before the results are set, so a caller woken by its result sees the counts
+            self.batches += 1
+            self.requests += len(requests)
+
+            for (_, future), text_covariates in zip(requests, covariates):
+                future.set_result(text_covariates)
+
+
+class _scoringHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        if self.path != '/surprisal':
+            self._reply(404, {'error': 'Unknown path ' + self.path})
+            return
+
+        try:
+            request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            future = self.server.batcher.submit(request['model_type'], request['words'], request.get('context', 50),
+                                                request.get('scoring_options'))
+            covariates = future.result()
+        except Exception as error:
+            self._reply(400, {'error': type(error).__name__ + ': ' + str(error)})
+            return
+
+        self._reply(200, {'columns': list(covariates.columns),
+                          'data': {column: covariates[column].tolist() for column in covariates.columns}})
+
+    def do_GET(self):
+        if self.path != '/status':
+            self._reply(404, {'error': 'Unknown path ' + self.path})
+            return
+
+        batcher = self.server.batcher
+        self._reply(200, {'batches': batcher.batches, 'requests': batcher.requests})
+
+    def _reply(self, status, body):
+        body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket clients have no host address
+        return str(self.client_address[0]) if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _unixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+
+
+class scoringServer:
+
+    def __init__(self, host='127.0.0.1', port=8765, socket_path=None, max_delay=0.01, max_words=20000,
+                 max_tokens=4096, preload=()):
+        self.batcher = microBatcher(max_delay, max_words, max_tokens)
+
+        # loading the models up front keeps the first requests from paying for it
+        for model_type in preload:
+            languageModel(model_type)
+
+        if socket_path is None:
+            self.httpd = ThreadingHTTPServer((host, port), _scoringHandler)
+            self.address = 'http://' + host + ':' + str(self.httpd.server_address[1])
+        else:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            self.httpd = _unixHTTPServer(socket_path, _scoringHandler)
+            self.address = 'unix://' + socket_path
+        self.httpd.batcher = self.batcher
+        self.socket_path = socket_path
+        self._thread = None
+
+    def serve_forever(self):
+        """Serves requests until shutdown is called from another thread
+
+        .. versionadded:: 0.0.0
+        """
+        self.batcher.start()
+        self.httpd.serve_forever()
+
+    def start(self):
+        """Serves requests from a background thread and returns the address of the server
+
+        .. versionadded:: 0.0.0
+        """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+        return self.address
+
+    def shutdown(self):
+        """Stops serving and closes the socket
+
+        .. versionadded:: 0.0.0
+        """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.batcher.stop()
+        if self._thread is not None:
+            self._thread.join()
+        if self.socket_path is not None and os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+class _unixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, socket_path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def remote_word_surprisal(address, model_type, clean_words, context=50, timeout=None, **scoring_options):
+    """ Calculates the surprisal of each word with a running scoring server
+
+    Parameters
+    ----------
+    address : str
+        the address of the server, 'http://host:port' or 'unix:///path/to/socket'
+
+    model_type : str
+        language model code to select the model to calculate surprisal
+
+    clean_words: list
+        list of words already cleaned by preprocessing_text.clean_text
+
+    context: int
+        the amount of words to be consided as context for caculating surprisal
+
+    timeout: float, optional
+        seconds to wait for the server
+
+    scoring_options:
+        keyword arguments passed on to batch_word_surprisal by the server
+
+    Returns
+    -------
+    covariates : DataFrame
+        the same columns as word_surprisal
+
+    .. versionadded:: 0.0.0
+    """
+    if address.startswith('unix://'):
+        connection = _unixHTTPConnection(address[len('unix://'):], timeout)
+    else:
+        connection = http.client.HTTPConnection(address.replace('http://', '').rstrip('/'), timeout=timeout)
+
+    body = json.dumps({'model_type': model_type, 'words': list(clean_words), 'context': context,
+                       'scoring_options': scoring_options})
+    try:
+        connection.request('POST', '/surprisal', body, {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        reply = json.loads(response.read())
+    finally:
+        connection.close()
+
+    if response.status != 200:
+        raise ValueError('The scoring server rejected the request: ' + reply['error'])
+
+    return pd.DataFrame(data={column: reply['data'][column] for column in reply['columns']})
+
+
+def default_server():
+    """Returns the scoring server address set by the SURPRISAL_SERVER environment variable or None"""
+
+    return os.environ.get('SURPRISAL_SERVER')
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Serve surprisal scoring from warm language models')
+    parser.add_argument('--host', default='127.0.0.1', help='The address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='The port to listen on')
+    parser.add_argument('--socket', default=None, help='Listen on this Unix socket instead of a port')
+    parser.add_argument('--max-delay-ms', type=float, default=10,
+                        help='How long the first request of a batch waits for others to join it')
+    parser.add_argument('--max-tokens', type=int, default=4096, help='The token budget of a padded batch')
+    parser.add_argument('--preload', nargs='*', default=[], help='The language model codes to load on start')
+    args = parser.parse_args()
+
+    server = scoringServer(args.host, args.port, args.socket, args.max_delay_ms / 1000,
+                           max_tokens=args.max_tokens, preload=args.preload)
+    print('Serving surprisal on ' + server.address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
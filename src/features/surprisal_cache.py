@@ -0,0 +1,282 @@
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import transformers
+
+from src.features.language_modelling import word_surprisal, release_model
+from src.features.scoring_server import remote_word_surprisal, default_server
+
+# scoring options that change how the surprisal is computed but not its value
+UNKEYED_OPTIONS = ('workers', 'threads_per_worker', 'checkpoint')
+
+
+class surprisalCache:
+
+    def __init__(self, directory, max_bytes=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, model_type, context, clean_words, scoring_options=None):
+        """Creates the content address of a surprisal computation
+
+        Parameters
+        ----------
+        model_type : str
+            language model code used to calculate surprisal
+
+        context: int
+            the amount of words consided as context for caculating surprisal
+
+        clean_words: list
+            the words after preprocessing_text.clean_text
+
+        scoring_options: dict, optional
+            keyword arguments passed to languageModel.word_probability, the options in
+            UNKEYED_OPTIONS are left out as they do not change the result
+
+        Returns
+        -------
+        key: str
+            hex digest naming the cache entry
+
+        .. versionadded:: 0.0.0
+        """
+        text_hash = hashlib.sha256(' '.join(clean_words).encode('utf-8')).hexdigest()
+        options = {name: value for name, value in (scoring_options or {}).items() if name not in UNKEYED_OPTIONS}
+        description = {'model': model_type, 'context': context, 'tokenizer': transformers.__version__,
+                       'text': text_hash, 'options': options}
+
+        return hashlib.sha256(json.dumps(description, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def load(self, key):
+        """Returns the cached covariates for key or None when the entry does not exist
+
+        .. versionadded:: 0.0.0
+        """
+        path = self._path(key)
+        try:
+            records = np.load(path)
+        except (OSError, ValueError):
+            return None
+
+        # the modification time records the last use for the eviction order
+        os.utime(path)
+
+        return pd.DataFrame(records)
+
+    def store(self, key, covariates):
+        """Writes the covariates DataFrame for key and evicts old entries when over the size bound
+
+        .. versionadded:: 0.0.0
+        """
+        # a unique temporary file, so processes storing the same key do not write into one file
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False) as f:
+            # a record array keeps the column names without pickling
+            np.save(f, covariates.to_records(index=False))
+        os.replace(f.name, self._path(key))
+
+        self.evict()
+
+    def entries(self):
+        """Lists the cache entries from least to most recently used
+
+        Returns
+        -------
+        entries: list
+            a tuple of the key, size in bytes and last use time of each entry
+        """
+        entries = []
+        for file in os.listdir(self.directory):
+            if file.endswith('.npy'):
+                stat = os.stat(os.path.join(self.directory, file))
+                entries.append((file[:-len('.npy')], stat.st_size, stat.st_mtime))
+
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def size(self):
+        """Returns the total size of the cache entries in bytes"""
+
+        return sum(entry[1] for entry in self.entries())
+
+    def evict(self):
+        """Removes the least recently used entries until the cache is within max_bytes
+
+        .. versionadded:: 0.0.0
+        """
+        if self.max_bytes is None:
+            return
+
+        entries = self.entries()
+        total = sum(entry[1] for entry in entries)
+        for key, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(self._path(key))
+            total -= size
+
+    def clear(self):
+        """Removes every entry from the cache"""
+
+        for key, _, _ in self.entries():
+            os.remove(self._path(key))
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+
+def default_cache():
+    """Returns the cache configured by the SURPRISAL_CACHE_DIR environment variable
+
+    Returns
+    -------
+    cache: surprisalCache
+        the cache in SURPRISAL_CACHE_DIR bounded by SURPRISAL_CACHE_MAX_MB megabytes, or None
+        when caching is not configured
+    """
+    directory = os.environ.get('SURPRISAL_CACHE_DIR')
+    if directory is None:
+        return None
+
+    max_megabytes = float(os.environ.get('SURPRISAL_CACHE_MAX_MB', 1024))
+
+    return surprisalCache(directory, int(max_megabytes * 1024 ** 2))
+
+
+def cached_word_surprisal(model_type, clean_words, context=50, cache=None, server=None, **scoring_options):
+    """ Returns the surprisal covariates of each word from the cache, computing and storing it on a miss
+
+    Parameters
+    ----------
+    model_type : str
+        language model code to select the model to calculate surprisal
+
+    clean_words: list
+        list of words already cleaned by preprocessing_text.clean_text
+
+    context: int
+        the amount of words to be consided as context for caculating surprisal
+
+    cache: surprisalCache, optional
+        the cache to use, default_cache() is used when not given
+
+    server: str, optional
+        address of a scoring_server to compute the surprisal on a miss, the SURPRISAL_SERVER
+        environment variable is used when not given
+
+    scoring_options:
+        keyword arguments passed on to languageModel.word_probability
+
+    Returns
+    -------
+    covariates : DataFrame
+        surprisal value in bits and the requested statistics of each word, see word_surprisal
+
+    Notes
+    -----
+    A cache hit neither tokenizes the text nor loads the language model. The scoring server
+    only takes a single context length, a list of context lengths is always computed locally
+
+    .. versionadded:: 0.0.0
+    """
+    if cache is None:
+        cache = default_cache()
+
+    if server is None:
+        server = default_server()
+
+    if cache is None:
+        return _compute_surprisal(model_type, clean_words, context, server, scoring_options)
+
+    key = cache.key(model_type, context, clean_words, scoring_options)
+    covariates = cache.load(key)
+    if covariates is None:
+        covariates = _compute_surprisal(model_type, clean_words, context, server, scoring_options)
+        cache.store(key, covariates)
+
+    return covariates
+
+
+def _compute_surprisal(model_type, clean_words, context, server, scoring_options):
+    """Computes the surprisal covariates on the scoring server when one is given, otherwise locally"""
+
+    if server is not None and not isinstance(context, (list, tuple)):
+        return remote_word_surprisal(server, model_type, clean_words, context, **scoring_options)
+
+    return word_surprisal(model_type, clean_words, context, **scoring_options)
+
+
+def joint_word_surprisal(model_types, clean_words, context=50, cache=None, server=None, **scoring_options):
+    """ Returns the surprisal covariates of each word for several language models in one table
+
+    Parameters
+    ----------
+    model_types : list
+        language model codes of the models to calculate surprisal with
+
+    clean_words: list
+        list of words already cleaned by preprocessing_text.clean_text
+
+    context: int or list
+        the amount of words to be consided as context for caculating surprisal
+
+    cache: surprisalCache, optional
+        the cache to use, default_cache() is used when not given
+
+    server: str, optional
+        address of a scoring_server to compute the surprisal with, see cached_word_surprisal
+
+    scoring_options:
+        keyword arguments passed on to languageModel.word_probability
+
+    Returns
+    -------
+    covariates : DataFrame
+        the columns of cached_word_surprisal for every model, suffixed with the model code,
+        eg 'Surprisal_gpt2' and 'Surprisal_txl'
+
+    Notes
+    -----
+    The models are run one after another and each one is released from the model registry
+    once its words are scored, so only one model is held in memory at a time
+
+    .. versionadded:: 0.0.0
+    """
+    covariates = pd.DataFrame()
+    for model_type in model_types:
+        model_covariates = cached_word_surprisal(model_type, clean_words, context, cache, server,
+                                                 **scoring_options)
+        release_model(model_type)
+
+        for column in model_covariates.columns:
+            covariates[column + '_' + model_type] = model_covariates[column].values
+
+    return covariates
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Inspect or clear the on-disk surprisal cache')
+    parser.add_argument('command', choices=['info', 'clear'], help='info lists the entries, clear removes them')
+    parser.add_argument('--directory', default=os.environ.get('SURPRISAL_CACHE_DIR'),
+                        help='The cache folder, defaults to SURPRISAL_CACHE_DIR')
+    args = parser.parse_args()
+
+    if args.directory is None:
+        parser.error('No cache folder given and SURPRISAL_CACHE_DIR is not set')
+
+    surprisal_cache = surprisalCache(args.directory)
+
+    if args.command == 'info':
+        entries = surprisal_cache.entries()
+        for key, size, _ in entries:
+            print(key, size)
+        print('{0} entries, {1} bytes'.format(len(entries), surprisal_cache.size()))
+
+    else:
+        surprisal_cache.clear()
@@ -1,35 +1,35 @@
 from src.data.text_preprocessing import preprocessing_text
-from src.features.language_modelling import languageModel
-from src.data.sequence_preprocessing import sequence_processor
+from src.features.surprisal_cache import cached_word_surprisal, joint_word_surprisal
 from src.data.eeg_preprocessing import EEGPreprocessor
 from src.models.eeg_regression import TimeResolvedRegression
 from sklearn.linear_model import  Ridge
-import pandas as pd
 
 
-def calculate_covariates(model_type, word_list, context=50):
+def calculate_covariates(model_type, word_list, context=50, cache=None, server=None, **scoring_options):
     # Preprocess words for language modelling
     text_processor = preprocessing_text()
     clean_words = text_processor.clean_text(word_list)
-    text = text_processor.word_list_to_string(clean_words)
 
-    # Sequence for Language models
-    sp = sequence_processor(model_type, text)
-    sp.tokenizeWords()
-    sp.text_to_sequences(context)
+    # Language model computation of surprisal and the requested statistics ('Surprisal', 'Entropy',
+    # 'Rank', 'Top_k'), suffixed with the context length for a sweep, read from the surprisal
+    # cache when configured and computed by the scoring server at server or SURPRISAL_SERVER when set
+    if isinstance(model_type, (list, tuple)):
+        # one set of columns for each model, suffixed with the model code
+        covariates = joint_word_surprisal(model_type, clean_words, context, cache, server, **scoring_options)
+    else:
+        covariates = cached_word_surprisal(model_type, clean_words, context, cache, server, **scoring_options)
 
-    # Language model computation of surprisal
-    model = languageModel(model_type)
-    model.word_probability(sp.indexed_sequences, sp.indexed_nextWord)
-    model.clean_predicted_words(sp.indexed_tokens[0])
+    return covariates
 
-    if(model_type =='gpt2' or model_type=='gpt2xl'):
-        model.collaspeSubWords(clean_words)
 
-    model.computeSurprisal()
+async def calculate_covariates_async(scorer, model_type, word_list, context=50, **scoring_options):
+    # Preprocess words for language modelling
+    text_processor = preprocessing_text()
+    clean_words = text_processor.clean_text(word_list)
 
-    covariate_name = 'Surprisal'
-    covariates = pd.DataFrame(data={covariate_name: model.surprisal})
+    # Language model computation of surprisal, batched with the other coroutines using scorer,
+    # an asyncScorer
+    covariates = await scorer.word_surprisal(model_type, clean_words, context, **scoring_options)
 
     return covariates
 
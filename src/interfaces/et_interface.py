@@ -1,5 +1,5 @@
 from src.data.text_preprocessing import preprocessing_text
-from src.features.language_modelling import languageModel
+from src.features.surprisal_cache import cached_word_surprisal
 from src.data.sequence_preprocessing import sequence_processor
 from src.data.et_preprocessing import eye_tracking_preprocessing
 
@@ -40,7 +40,7 @@ def preprocess_reading_data(reading_data, text_column, metric_column, threshold)
     return eye_track, word_list
 
 
-def calculate_covariates(model_type, word_list, context=50):
+def calculate_covariates(model_type, word_list, context=50, cache=None, server=None, **scoring_options):
     """ Removes non-ascii characters from words in word list
 
         Parameters
@@ -51,8 +51,19 @@ def calculate_covariates(model_type, word_list, context=50):
         word_list: list
             list of words for surprisal to be calculated for
 
-        context: int
-            the amount of words to be consided as context for caculating surprisal
+        context: int or list
+            the amount of words to be consided as context for caculating surprisal, a list of
+            context lengths gives a list of surprisal values for each of them
+
+        cache: surprisalCache, optional
+            cache of previously computed surprisal values, SURPRISAL_CACHE_DIR is used when not given
+
+        server: str, optional
+            address of a running scoring_server that computes the surprisal, eg 'http://127.0.0.1:8765'
+            or 'unix:///tmp/surprisal.sock'. SURPRISAL_SERVER is used when not given
+
+        scoring_options:
+            keyword arguments passed on to languageModel.word_probability, eg stride or max_tokens
 
         Returns
         -------
@@ -73,24 +84,20 @@ def calculate_covariates(model_type, word_list, context=50):
     text = text_processor.word_list_to_string(clean_words)
 
 
-    # Sequence for Language models
+    # Word length and frequency covariates
     sp = sequence_processor(model_type, text)
-    sp.tokenizeWords()
-    sp.text_to_sequences(context)
     sp.word_frequency_length()
     word_length = sp.word_lengths
     word_frequency = sp.word_frequencies
 
-    # Language model commputation of surprisal
-    model = languageModel(model_type)
-    model.word_probability(sp.indexed_sequences, sp.indexed_nextWord)
-    model.clean_predicted_words(sp.indexed_tokens[0])
-
-    if (model_type == 'gpt2' or model_type == 'gpt2xl'):
-        model.collaspeSubWords(clean_words)
+    # Language model commputation of surprisal, read from the surprisal cache when configured
+    covariates = cached_word_surprisal(model_type, clean_words, context, cache, server, **scoring_options)
 
-    model.computeSurprisal()
+    if isinstance(context, (list, tuple)):
+        surprisal = [covariates['Surprisal_' + str(length)].tolist() for length in context]
+    else:
+        surprisal = covariates['Surprisal'].tolist()
 
-    return model.surprisal, word_length, word_frequency
+    return surprisal, word_length, word_frequency
 
 
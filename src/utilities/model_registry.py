@@ -0,0 +1,197 @@
+import os
+import threading
+from collections import OrderedDict
+
+import torch
+
+
+class modelRegistry:
+
+    def __init__(self, memory_budget=None):
+        self.memory_budget = memory_budget
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key, loader):
+        """Returns the object stored under key, loading it with loader the first time it is asked for
+
+        Parameters
+        ----------
+        key : hashable
+            name the object is stored under, eg ('model', 'gpt2')
+
+        loader: callable
+            function without arguments that loads the object when it is not in the registry
+
+        Returns
+        -------
+        value:
+            the shared object stored under key
+
+        Notes
+        -----
+        When the memory of the stored objects goes over the memory budget the least recently
+        used objects are evicted until it fits again. An evicted model stays alive for as long
+        as something still holds a reference to it
+
+        .. versionadded:: 0.0.0
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+
+            value = loader()
+            self.loads += 1
+            self._entries[key] = (value, memory_footprint(value))
+            self._evict(keep=key)
+
+            return value
+
+    def release(self, key):
+        """Removes the object stored under key from the registry
+
+        .. versionadded:: 0.0.0
+        """
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.evictions += 1
+
+    def release_matching(self, predicate):
+        """Removes every object whose key satisfies predicate from the registry
+
+        .. versionadded:: 0.0.0
+        """
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                self.release(key)
+
+    def resize(self, key, size):
+        """Records the new memory of an object that grew after it was stored and evicts other
+        models until the registry fits in the budget again
+
+        .. versionadded:: 0.0.0
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries[key] = (self._entries[key][0], size)
+                self._evict(keep=key)
+
+    def set_memory_budget(self, memory_budget):
+        """Sets the memory budget in bytes and evicts models until the registry fits in it
+
+        .. versionadded:: 0.0.0
+        """
+        with self._lock:
+            self.memory_budget = memory_budget
+            self._evict()
+
+    def memory_usage(self):
+        """Returns the number of bytes held by the parameters of the registered models"""
+
+        with self._lock:
+            return sum(size for _, size in self._entries.values())
+
+    def stats(self):
+        """Returns the load, hit and eviction counts with the keys and memory of the registered objects
+
+        .. versionadded:: 0.0.0
+        """
+        with self._lock:
+            return {'loads': self.loads, 'hits': self.hits, 'evictions': self.evictions,
+                    'keys': list(self._entries), 'memory': self.memory_usage(),
+                    'memory_budget': self.memory_budget}
+
+    def clear(self):
+        """Removes every object from the registry and resets the counts"""
+
+        with self._lock:
+            self._entries.clear()
+            self.loads = 0
+            self.hits = 0
+            self.evictions = 0
+
+    def _evict(self, keep=None):
+        """Evicts the least recently used models until the memory is within the budget"""
+
+        if self.memory_budget is None:
+            return
+
+        for key in list(self._entries):
+            if self.memory_usage() <= self.memory_budget:
+                break
+            # objects without parameters such as tokenizers free nothing when evicted
+            if key == keep or self._entries[key][1] == 0:
+                continue
+            del self._entries[key]
+            self.evictions += 1
+
+
+def memory_footprint(value, exclude=None):
+    """Estimates the bytes held by the parameters and buffers of the models in value
+
+    Parameters
+    ----------
+    value:
+        a torch module, a tuple, list or dict of objects or any other object which counts as zero
+
+    exclude: optional
+        objects whose tensors are not counted, eg the model a traced graph shares its weights with
+
+    Returns
+    -------
+    size: int
+        number of bytes
+    """
+    excluded = _tensor_sizes(exclude, {}) if exclude is not None else {}
+    tensors = _tensor_sizes(value, {})
+
+    return sum(size for data_ptr, size in tensors.items() if data_ptr not in excluded)
+
+
+def _tensor_sizes(value, tensors):
+    """Adds the bytes of each tensor held by value to tensors, keyed by its memory address so
+    tensors shared between models, such as tied weights, are only counted once"""
+
+    if isinstance(value, dict):
+        value = list(value.values())
+
+    if isinstance(value, (tuple, list)):
+        for item in value:
+            _tensor_sizes(item, tensors)
+
+    elif isinstance(value, torch.nn.Module):
+        # the state dict also holds the packed weights of quantized layers, which are not
+        # parameters
+        for tensor in _state_tensors(value.state_dict(keep_vars=True).values()):
+            tensors[tensor.data_ptr()] = tensor.numel() * tensor.element_size()
+
+    return tensors
+
+
+def _state_tensors(values):
+    """Yields the tensors in a list of state dict values, which may hold tuples of tensors"""
+
+    for value in values:
+        if isinstance(value, torch.Tensor):
+            yield value
+        elif isinstance(value, (tuple, list)):
+            yield from _state_tensors(value)
+
+
+def _memory_budget_from_environment():
+    """Reads the memory budget in gigabytes from the LM_MEMORY_BUDGET_GB environment variable"""
+
+    budget = os.environ.get('LM_MEMORY_BUDGET_GB')
+    if budget is None:
+        return None
+
+    return int(float(budget) * 1024 ** 3)
+
+
+# registry shared by every languageModel and sequence_processor in the process
+registry = modelRegistry(_memory_budget_from_environment())
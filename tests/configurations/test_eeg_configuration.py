@@ -7,6 +7,7 @@ from random_words import RandomWords
 import os
 from os import path
 import pandas as pd
+from types import SimpleNamespace
 
 class TestSingleRun:
 
@@ -60,3 +61,22 @@ class TestSingleRun:
         assert actual_surprisal == True
         os.remove(plot_path)
 
+
+
+class TestMultiModelRun:
+
+    def test_plots_saved_per_model(self, tmpdir, monkeypatch):
+        covariates = pd.DataFrame(data={'Surprisal_gpt2': [1.0, 2.0], 'Surprisal_txl': [3.0, 4.0]})
+        regression_data = SimpleNamespace(conds=None, cond_length=None, tmin_s=None, tmax_s=None, info=None)
+        monkeypatch.setattr(eec.util, 'read_flaten_word_list', lambda path: ['this', 'is'])
+        monkeypatch.setattr(eec.eec, 'calculate_covariates', lambda *args: covariates)
+        monkeypatch.setattr(eec.eec, 'preprocessed_eeg_raw', lambda *args: (None, None))
+        monkeypatch.setattr(eec.eec, 'time_resolved_regression', lambda *args: (None, regression_data))
+        monkeypatch.setattr(eec.trr, '_make_evokeds', lambda *args: {})
+        folders = []
+        monkeypatch.setattr(eec.ev, 'plot_rERP', lambda evoked, output_file: folders.append(output_file))
+
+        eec.multi_model_run(['gpt2', 'txl'], 5, 'text.txt', 'channels.txt', 'eeg.mat', 'events.mat', 'onset',
+                            'biosemi128', str(tmpdir))
+        assert folders == [os.path.join(str(tmpdir), 'gpt2', ''), os.path.join(str(tmpdir), 'txl', '')]
+        assert os.path.isdir(folders[0]) and os.path.isdir(folders[1])
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from src.data.context_windows import contextWindows, sliding_windows
+
+
+class TestSlidingWindows():
+
+    @pytest.fixture
+    def setup_windows(self):
+        yield sliding_windows(np.arange(10, 20), 3)
+
+    def test_matches_list_slices(self, setup_windows):
+        windows, next_items = setup_windows
+        tokens = list(range(10, 20))
+        expected = [tokens[max(0, i - 3):i + 1] for i in range(len(tokens) - 1)]
+        assert windows.tolist() == expected
+        assert list(next_items) == tokens[1:]
+
+    def test_windows_are_views(self, setup_windows):
+        windows, next_items = setup_windows
+        assert np.shares_memory(windows[5], windows.tokens)
+        assert np.shares_memory(next_items, windows.tokens)
+
+    def test_windows_are_read_only(self, setup_windows):
+        windows, _ = setup_windows
+        with pytest.raises(ValueError):
+            windows[5][0] = 0
+
+    def test_elements_are_python_scalars(self, setup_windows):
+        windows, next_items = setup_windows
+        assert type(windows[5][0]) == int
+        assert type(next_items[0]) == int
+
+    def test_words(self):
+        windows, next_items = sliding_windows(np.array(['this', 'is', 'a', 'test']), 1)
+        assert windows.tolist() == [['this'], ['this', 'is'], ['is', 'a']]
+        assert type(next_items[0]) == str
+
+    def test_short_text(self):
+        windows, next_items = sliding_windows(np.array([5]), 3)
+        assert len(windows) == 0
+        assert len(next_items) == 0
+
+
+class TestContextWindows():
+
+    def test_padded(self):
+        windows = contextWindows(np.arange(1, 7), [0, 2, 3], [2, 5, 4])
+        padded, mask = windows.padded()
+        assert padded.tolist() == [[1, 2, 0], [3, 4, 5], [4, 0, 0]]
+        assert mask.sum(axis=1).tolist() == [2, 3, 1]
+
+    def test_select_windows(self):
+        windows = contextWindows(np.arange(1, 7), [0, 2, 3], [2, 5, 4])
+        actual = windows[[2, 0]].tolist()
+        expected = [[4], [1, 2]]
+        assert actual == expected
+
+    def test_concatenate(self):
+        first = contextWindows(np.array([1, 2, 3]), [0, 1], [2, 3])
+        second = contextWindows(np.array([4, 5]), [0], [2])
+        actual = contextWindows.concatenate([first, second]).tolist()
+        expected = [[1, 2], [2, 3], [4, 5]]
+        assert actual == expected
@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+import pytest
+from src.data.embedding_store import embeddingStore, convert_glove, load_embeddings
+
+
+@pytest.fixture
+def setup_glove(tmpdir):
+    words = ['the', 'a', 'is', 'this', 'test', 'sample', 'text', 'string', 'for', 'purposes']
+    vectors = np.random.RandomState(0).randn(len(words), 5).astype(np.float32)
+    path = str(tmpdir.join('glove.test.5d.txt'))
+    with open(path, 'w') as f:
+        for word, vector in zip(words, vectors):
+            f.write(word + ' ' + ' '.join(str(value) for value in vector) + '\n')
+    yield path, words, vectors
+
+
+class TestConvertGlove():
+
+    def test_vectors_match_file(self, setup_glove, tmpdir):
+        path, words, vectors = setup_glove
+        convert_glove(path, str(tmpdir.join('store')))
+        store = embeddingStore(str(tmpdir.join('store')))
+        assert np.array_equal(np.asarray(store.vectors), vectors)
+        assert store.words.tolist() == words
+
+    def test_limit(self, setup_glove, tmpdir):
+        path, words, vectors = setup_glove
+        convert_glove(path, str(tmpdir.join('store')), limit=4)
+        store = embeddingStore(str(tmpdir.join('store')))
+        assert store.vectors.shape == (4, 5)
+        assert store.lookup(['test']).tolist() == [-1]
+
+    def test_mean_covers_every_embedding(self, setup_glove, tmpdir):
+        path, words, vectors = setup_glove
+        convert_glove(path, str(tmpdir.join('store')), limit=4)
+        store = embeddingStore(str(tmpdir.join('store')))
+        assert np.allclose(store.mean_vector, vectors.mean(axis=0), atol=1e-6)
+
+
+    def test_other_writers_temporary_files_untouched(self, setup_glove, tmpdir):
+        path, words, vectors = setup_glove
+        os.makedirs(str(tmpdir.join('store')))
+        tmpdir.join('store', 'manifest.json.tmp').write('other')
+        convert_glove(path, str(tmpdir.join('store')))
+        assert tmpdir.join('store', 'manifest.json.tmp').read() == 'other'
+        assert sorted(os.listdir(str(tmpdir.join('store')))) == ['hashes.npy', 'manifest.json', 'manifest.json.tmp',
+                                                                 'mean.npy', 'order.npy', 'vectors.npy', 'words.npy']
+
+
+class TestEmbeddingStore():
+
+    def test_lookup(self, setup_glove, tmpdir):
+        path, words, vectors = setup_glove
+        store = load_embeddings(path, str(tmpdir.join('store')))
+        actual = store.lookup(['test', 'unknown', 'the']).tolist()
+        expected = [4, -1, 0]
+        assert actual == expected
+
+    def test_vectors_are_read_only_memory_maps(self, setup_glove, tmpdir):
+        path, words, vectors = setup_glove
+        store = load_embeddings(path, str(tmpdir.join('store')))
+        assert type(store.vectors) == np.memmap
+        with pytest.raises(ValueError):
+            store.vectors[0, 0] = 0
+
+    def test_converted_once(self, setup_glove, tmpdir):
+        path, words, vectors = setup_glove
+        load_embeddings(path, str(tmpdir.join('store')))
+        modified = os.path.getmtime(str(tmpdir.join('store', 'vectors.npy')))
+        load_embeddings(path, str(tmpdir.join('store')))
+        assert os.path.getmtime(str(tmpdir.join('store', 'vectors.npy'))) == modified
+
+    def test_changed_file_converted_again(self, setup_glove, tmpdir):
+        path, words, vectors = setup_glove
+        load_embeddings(path, str(tmpdir.join('store')))
+        with open(path, 'a') as f:
+            f.write('new 1 2 3 4 5\n')
+        store = load_embeddings(path, str(tmpdir.join('store')))
+        actual = store.lookup(['new']).tolist()
+        expected = [len(words)]
+        assert actual == expected
+
+    def test_default_directory(self, setup_glove, monkeypatch):
+        path, words, vectors = setup_glove
+        monkeypatch.delenv('EMBEDDING_STORE_DIR', raising=False)
+        load_embeddings(path)
+        assert os.path.exists(os.path.join(path + '.store', 'manifest.json'))
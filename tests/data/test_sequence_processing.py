@@ -1,8 +1,11 @@
 import pytest
-from src.data.sequence_preprocessing import sequence_processor
+from src.data.sequence_preprocessing import sequence_processor, tokenize_texts, benchmark_tokenizers
 from transformers import GPT2Tokenizer, TransfoXLTokenizer, CTRLTokenizer
 import numpy as np
 import pandas as pd
+from scipy.stats import pearsonr
+from src.data.token_store import tokenStore
+from src.utilities.model_registry import registry
 
 class TestSequenceProcessorInit():
 
@@ -91,6 +94,122 @@ class TestTokenizeWords():
         expected =1
         assert actual == expected
 
+class TestWordIds():
+
+    def test_word_id_for_each_token(self):
+        test_case = 'gpt2'
+        text = 'This is a sample text string for testing purposes'
+        sp = sequence_processor(test_case, text)
+        sp.tokenizeWords()
+        actual = len(sp.word_ids)
+        expected = len(sp.indexed_tokens)
+        assert actual == expected
+
+    def test_word_ids_cover_every_word(self):
+        test_case = 'ctrl'
+        text = 'This is a sample text string for testing purposes'
+        sp = sequence_processor(test_case, text)
+        sp.tokenizeWords()
+        actual = np.unique(sp.word_ids).tolist()
+        expected = list(range(len(text.split(' '))))
+        assert actual == expected
+
+    def test_tokens_match_encoding_whole_text(self):
+        test_case = 'gpt2'
+        text = 'This is a sample text string for testing purposes'
+        sp = sequence_processor(test_case, text)
+        sp.tokenizeWords()
+        actual = sp.indexed_tokens
+        expected = sp.tokenizer.encode(text)
+        assert actual == expected
+
+class TestTokenStoreTokenizeWords():
+
+    def test_stored_tokens_match(self, tmpdir):
+        text = 'this is an example string to use for testing purposes'
+        store = tokenStore(str(tmpdir))
+        sp = sequence_processor('gpt2', text)
+        sp.tokenizeWords(store=store)
+        stored_sp = sequence_processor('gpt2', text)
+        stored_sp.tokenizeWords(store=store)
+        assert stored_sp.indexed_tokens == sp.indexed_tokens
+        assert stored_sp.word_ids.tolist() == sp.word_ids.tolist()
+        assert stored_sp.word_offsets.tolist() == sp.word_offsets.tolist()
+
+    def test_stored_tokens_skip_tokenizer(self, tmpdir, monkeypatch):
+        text = 'this is an example string to use for testing purposes'
+        store = tokenStore(str(tmpdir))
+        expected_sp = sequence_processor('gpt2', text)
+        expected_sp.tokenizeWords(store=store)
+        expected_sp.text_to_sequences(3)
+        registry.release(('tokenizer', 'gpt2'))
+
+        def fail(modelType):
+            raise AssertionError('The tokenizer was loaded')
+
+        monkeypatch.setattr(sequence_processor, '_loadTokenizer', staticmethod(fail))
+        sp = sequence_processor('gpt2', text)
+        sp.tokenizeWords(store=store)
+        sp.text_to_sequences(3)
+        assert sp.indexed_sequences == expected_sp.indexed_sequences
+        assert list(sp.indexed_nextWord) == list(expected_sp.indexed_nextWord)
+
+    def test_word_offsets(self):
+        sp = sequence_processor('gpt2', 'this is an example')
+        sp.tokenizeWords()
+        actual = [sp.word_ids[offset] for offset in sp.word_offsets[:-1]]
+        expected = [0, 1, 2, 3]
+        assert actual == expected
+        assert sp.word_offsets[-1] == len(sp.indexed_tokens)
+
+
+class TestFastTokenizer():
+
+    @pytest.fixture
+    def setup_texts(self):
+        yield ['when the train finally pulled into the station it was already dark',
+               'she carried her bag over the cobbles and asked whether there was a room',
+               'the 1990s weren\'t   all that different , said the café owner',
+               'x']
+
+    def test_identical_to_slow_tokenizer(self, setup_texts):
+        for text in setup_texts:
+            slow_sp = sequence_processor('gpt2', text)
+            slow_sp.tokenizeWords(store=False)
+            fast_sp = sequence_processor('gpt2', text, 'fast')
+            fast_sp.tokenizeWords(store=False)
+            assert fast_sp.indexed_tokens == slow_sp.indexed_tokens
+            assert fast_sp.word_ids.tolist() == slow_sp.word_ids.tolist()
+
+    def test_identical_in_stream(self):
+        slow_sp = sequence_processor('gpt2', 'the rest of the stream')
+        slow_sp.tokenizeWords(first_word_index=10)
+        fast_sp = sequence_processor('gpt2', 'the rest of the stream', 'fast')
+        fast_sp.tokenizeWords(first_word_index=10)
+        assert fast_sp.indexed_tokens == slow_sp.indexed_tokens
+
+    def test_batch_matches_single_texts(self, setup_texts):
+        processors = tokenize_texts('gpt2', setup_texts, 'fast', store=False)
+        for text, sp in zip(setup_texts, processors):
+            single_sp = sequence_processor('gpt2', text, 'fast')
+            single_sp.tokenizeWords(store=False)
+            assert sp.indexed_tokens == single_sp.indexed_tokens
+            assert sp.word_offsets.tolist() == single_sp.word_offsets.tolist()
+
+    def test_benchmark(self, setup_texts):
+        report = benchmark_tokenizers('gpt2', setup_texts * 10, repeats=1)
+        assert report['identical']
+        assert report['fast_words_per_second'] > 0
+
+    def test_unavailable_model(self):
+        with pytest.raises(ValueError):
+            sequence_processor('txl', 'this is a test', 'fast')
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            sequence_processor('gpt2', 'this is a test', 'compiled')
+
+
 class TestTextToSequence():
 
     def test_next_word_is_last_word_in_previous_sequence(self):
@@ -296,3 +415,57 @@ class TestSemanticDissimlarity():
         expected = 0
         assert actual == expected
 
+
+
+class TestStoredEmbeddingsSemanticDissimilarity():
+
+    @pytest.fixture
+    def setup_glove(self, tmpdir):
+        words = ['the', 'a', 'is', 'this', 'sample', 'text', 'string', 'for', 'testing']
+        vectors = np.random.RandomState(0).randn(len(words), 10)
+        path = str(tmpdir.join('glove.test.10d.txt'))
+        with open(path, 'w') as f:
+            for word, vector in zip(words, vectors):
+                f.write(word + ' ' + ' '.join(str(value) for value in vector) + '\n')
+        yield path, dict(zip(words, vectors.astype(np.float32))), vectors.astype(np.float32).mean(axis=0)
+
+    def test_matches_embeddings(self, setup_glove, tmpdir):
+        path, glove, unknown = setup_glove
+        text = 'this is a sample text string for testing purposes'
+        sp = sequence_processor('gpt2', text)
+        sp.text_to_word_sequences(3)
+        sp.calc_semantic_dissimilarity(path, str(tmpdir.join('store')))
+
+        word_list = text.split(' ')
+        expected = [0]
+        for i in range(1, len(word_list)):
+            context = [glove[word] for word in word_list[max(0, i - 4):i] if word in glove]
+            average = np.sum(context, axis=0) / len(context)
+            expected.append(1 - pearsonr(glove.get(word_list[i], unknown), average)[0])
+
+        assert type(sp.Semantic_disimilarity) == list
+        assert sp.Semantic_disimilarity == pytest.approx(expected, abs=1e-5)
+
+    def test_long_context(self, setup_glove, tmpdir):
+        path, glove, unknown = setup_glove
+        text = ' '.join(['this is a sample text string for testing purposes'] * 20)
+        sp = sequence_processor('gpt2', text)
+        sp.text_to_word_sequences(50)
+        sp.calc_semantic_dissimilarity(path, str(tmpdir.join('store')))
+
+        word_list = text.split(' ')
+        expected = [0]
+        for i in range(1, len(word_list)):
+            context = [glove[word] for word in word_list[max(0, i - 51):i] if word in glove]
+            average = np.sum(context, axis=0) / len(context)
+            expected.append(1 - pearsonr(glove.get(word_list[i], unknown), average)[0])
+
+        assert sp.Semantic_disimilarity == pytest.approx(expected, abs=1e-5)
+
+    def test_window_without_known_word(self, setup_glove, tmpdir):
+        path, glove, unknown = setup_glove
+        sp = sequence_processor('gpt2', 'purposes this is')
+        sp.text_to_word_sequences(0)
+        sp.calc_semantic_dissimilarity(path, str(tmpdir.join('store')))
+        assert np.isnan(sp.Semantic_disimilarity[1])
+        assert not np.isnan(sp.Semantic_disimilarity[2])
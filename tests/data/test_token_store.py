@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+import pytest
+from src.data.token_store import tokenStore, default_store
+
+
+class TestTokenStore():
+
+    @pytest.fixture
+    def setup_store(self, tmpdir):
+        yield tokenStore(str(tmpdir))
+
+    def test_roundtrip(self, setup_store):
+        key = setup_store.key('gpt2', 'this is a test')
+        setup_store.store(key, [1, 2, 3, 4, 5], [0, 1, 2, 3, 3], [0, 1, 2, 3, 5])
+        tokens, word_ids, offsets = setup_store.load(key)
+        assert tokens.tolist() == [1, 2, 3, 4, 5]
+        assert word_ids.tolist() == [0, 1, 2, 3, 3]
+        assert offsets.tolist() == [0, 1, 2, 3, 5]
+
+    def test_loads_memory_map(self, setup_store):
+        key = setup_store.key('gpt2', 'this is a test')
+        setup_store.store(key, [1, 2, 3, 4], [0, 1, 2, 3], [0, 1, 2, 3, 4])
+        actual = type(setup_store.load(key)[0])
+        expected = np.memmap
+        assert actual == expected
+
+    def test_other_writers_temporary_file_untouched(self, setup_store, tmpdir):
+        key = setup_store.key('gpt2', 'this is a test')
+        tmpdir.join(key + '.tokens.npy.tmp').write('other')
+        setup_store.store(key, [1, 2, 3, 4], [0, 1, 2, 3], [0, 1, 2, 3, 4])
+        assert tmpdir.join(key + '.tokens.npy.tmp').read() == 'other'
+        assert [file for file in os.listdir(str(tmpdir)) if file.endswith('.tmp')] == [key + '.tokens.npy.tmp']
+
+    def test_missing_entry(self, setup_store):
+        actual = setup_store.load(setup_store.key('gpt2', 'this is a test'))
+        expected = None
+        assert actual == expected
+
+    def test_key_depends_on_model_and_text(self, setup_store):
+        key = setup_store.key('gpt2', 'this is a test')
+        assert key != setup_store.key('ctrl', 'this is a test')
+        assert key != setup_store.key('gpt2', 'this is another test')
+        assert key != setup_store.key('gpt2', 'this is a test', tokenizer='fast')
+
+    def test_decode_table_roundtrip(self, setup_store):
+        decode_table = np.array(['this', '', 'test'], dtype=object)
+        setup_store.store_decode_table('gpt2', decode_table)
+        actual = setup_store.load_decode_table('gpt2').tolist()
+        expected = ['this', '', 'test']
+        assert actual == expected
+
+    def test_default_store_unset(self, monkeypatch):
+        monkeypatch.delenv('TOKEN_STORE_DIR', raising=False)
+        actual = default_store()
+        expected = None
+        assert actual == expected
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+from src.features.async_scoring import asyncScorer
+from src.features.language_modelling import word_surprisal
+
+
+class TestAsyncScorer():
+
+    def test_matches_word_surprisal(self):
+        words = ['this', 'is', 'a', 'test', 'of', 'the', 'language', 'models']
+
+        async def score():
+            async with asyncScorer() as scorer:
+                return await scorer.word_surprisal('gpt2', words, 5)
+
+        actual = asyncio.run(score())['Surprisal'].tolist()
+        expected = word_surprisal('gpt2', words, 5)['Surprisal'].tolist()
+        assert actual == pytest.approx(expected, abs=1e-4)
+
+    def test_concurrent_requests_are_coalesced(self):
+        word_lists = [['this', 'is', 'a', 'test'], ['it', 'will', 'be', 'used'], ['for', 'testing', 'purposes']]
+
+        async def score():
+            async with asyncScorer(max_delay=0.5) as scorer:
+                results = await asyncio.gather(*[scorer.word_surprisal('gpt2', words, 5) for words in word_lists])
+                return results, scorer.batcher.batches
+
+        results, batches = asyncio.run(score())
+        assert [len(result) for result in results] == [4, 4, 3]
+        assert batches == 1
+
+    def test_identical_requests_are_deduplicated(self):
+        words = ['this', 'is', 'a', 'test']
+
+        async def score():
+            async with asyncScorer(max_delay=0.1) as scorer:
+                results = await asyncio.gather(*[scorer.word_surprisal('gpt2', words, 5) for _ in range(3)])
+                return results, scorer.deduplicated, scorer.batcher.requests
+
+        results, deduplicated, requests = asyncio.run(score())
+        assert deduplicated == 2
+        assert requests == 1
+        # every caller owns its result
+        results[0]['Surprisal'] = 0.0
+        assert results[1]['Surprisal'].tolist() != results[0]['Surprisal'].tolist()
+
+    def test_error_is_raised_in_caller(self):
+
+        async def score():
+            async with asyncScorer() as scorer:
+                return await scorer.word_surprisal('unknown', ['this', 'is', 'a', 'test'], 5)
+
+        with pytest.raises(NameError):
+            asyncio.run(score())
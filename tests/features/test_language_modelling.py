@@ -1,8 +1,43 @@
+import math
+import os
+
+import numpy as np
 import pytest
-from src.features.language_modelling import languageModel
+import torch
+from src.features import language_modelling
+from src.features.language_modelling import languageModel, quantization_report, benchmark_backends, _conv1d_to_linear, \
+    stream_word_surprisal, word_surprisal
+from src.utilities.model_registry import registry, memory_footprint
 from src.data.sequence_preprocessing import sequence_processor
+from src.data.context_windows import contextWindows
 from transformers import GPT2Tokenizer, GPT2LMHeadModel, TransfoXLTokenizer, TransfoXLLMHeadModel, CTRLTokenizer,CTRLLMHeadModel
 
+WORD_LIST = ['this', 'is', 'an', 'example', 'string', 'to',
+             'use', 'for', 'testing', 'purposes', 'it', 'will',
+             'be', 'used', 'to', 'test', 'output', 'of',
+             'language', 'models']
+
+
+@pytest.fixture
+def model_type():
+    return 'gpt2'
+
+
+@pytest.fixture
+def context_length():
+    return 4
+
+
+@pytest.fixture
+def setup_processor(model_type, context_length):
+    """WORD_LIST tokenized for model_type and split into sequences of context_length words. A test class
+    overrides either by defining a fixture of the same name, a context_length of None leaves the text unsplit"""
+    sp = sequence_processor(model_type, ' '.join(WORD_LIST))
+    sp.tokenizeWords()
+    if context_length is not None:
+        sp.text_to_sequences(context_length)
+    yield sp
+
 
 class TestLanguageModelLoader():
 
@@ -103,6 +138,98 @@ class TestWordProbability():
         assert actual_prob_type == expected_prob_type
         assert actual_word_type == expected_word_type
 
+class TestContextWindowsWordProbability():
+
+    @pytest.mark.parametrize('options', [{}, {'max_tokens': 32}, {'stride': 2}])
+    def test_matches_lists(self, setup_processor, options):
+        sp = setup_processor
+        lm = languageModel('gpt2')
+        lm.word_probability(sp.indexed_sequences.tolist(), list(sp.indexed_nextWord), **options)
+        expected = lm.log_probability.tolist()
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, **options)
+        actual = lm.log_probability.tolist()
+        assert actual == expected
+
+
+class TestStridedWordProbability():
+
+    def test_stride_one_matches_unstrided(self, setup_processor):
+        sp = setup_processor
+        lm = languageModel('gpt2')
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord)
+        expected = lm.probability
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, stride=1)
+        actual = lm.probability
+        assert actual == pytest.approx(expected, rel=1e-4)
+
+    def test_length_of_strided_probability(self, setup_processor):
+        sp = setup_processor
+        lm = languageModel('gpt2')
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, stride=3)
+        actual = len(lm.probability)
+        expected = len(sp.indexed_nextWord)
+        assert actual == expected
+
+    def test_single_token_text(self, setup_processor):
+        sp = setup_processor
+        lm = languageModel('gpt2')
+        # a text of one token has no sequences and no next words
+        lm.word_probability(sp.indexed_sequences[:0], [], stride=1)
+        actual = len(lm.probability)
+        expected = 0
+        assert actual == expected
+
+    def test_stride_longer_than_window_error(self, setup_processor):
+        sp = setup_processor
+        lm = languageModel('gpt2')
+        with pytest.raises(ValueError):
+            lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, stride=10)
+
+
+class TestBatchedWordProbability():
+
+    def test_batched_matches_unbatched(self, setup_processor):
+        sp = setup_processor
+        lm = languageModel('gpt2')
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord)
+        expected = lm.probability
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, max_tokens=32)
+        actual = lm.probability
+        assert actual == pytest.approx(expected, rel=1e-4, abs=1e-7)
+
+    def test_batches_respect_token_budget(self, setup_processor):
+        sp = setup_processor
+        lm = languageModel('gpt2')
+        batches = lm._length_buckets(sp.indexed_sequences, 12)
+        for batch in batches:
+            length = max(len(sp.indexed_sequences[i]) for i in batch)
+            assert len(batch) == 1 or len(batch) * length <= 12
+
+    def test_batches_cover_every_sequence(self, setup_processor):
+        sp = setup_processor
+        lm = languageModel('gpt2')
+        batches = lm._length_buckets(sp.indexed_sequences, 12)
+        actual = sorted(i for batch in batches for i in batch)
+        expected = list(range(len(sp.indexed_sequences)))
+        assert actual == expected
+
+
+class TestDecodeTokens():
+
+    def test_matches_decoding_each_token(self):
+        lm = languageModel('gpt2')
+        token_ids = lm.tokenizer.encode('this is an example string for testing')
+        actual = lm.decode_tokens(token_ids)
+        expected = [lm.tokenizer.decode(token).replace(' ', '') for token in token_ids]
+        assert actual == expected
+
+    def test_decoded_words_are_strings(self):
+        lm = languageModel('gpt2')
+        actual = type(lm.decode_tokens([100, 200])[0])
+        expected = str
+        assert actual == expected
+
+
 class TestCleanPredictedToken():
 
     @pytest.fixture
@@ -143,28 +270,519 @@ class TestCleanPredictedToken():
 class TestCollaspeSubWords():
 
     @pytest.fixture
-    def setup_clean_words(self):
-        word_list = ['this', 'is', 'an', 'example', 'string', 'to',
-                     'use', 'for', 'testing', 'purposes' 'it', 'will'
-                     'be', 'used', 'to', 'test', 'output', 'of',
-                     'language', 'models']
-        text = ' '.join(word_list)
-
-        sp = sequence_processor('gpt2', text)
-        sp.tokenizeWords()
-        sp.text_to_sequences(4)
+    def setup_clean_words(self, setup_processor):
+        sp = setup_processor
         lm = languageModel('gpt2')
         lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord)
         lm.clean_predicted_words(sp.indexed_tokens[0])
-        lm.collaspeSubWords(word_list)
+        lm.collaspeSubWords(WORD_LIST)
 
         yield lm.word
 
     def test_return_length_equals_original(self, setup_clean_words):
         actual = len(setup_clean_words)
-        expected = len(setup_clean_words)
+        expected = len(WORD_LIST)
+        assert actual == expected
+
+
+class TestCollaspeSubWordsWithWordIds():
+
+    @pytest.fixture
+    def setup_language_model(self, setup_processor):
+        sp = setup_processor
+        lm = languageModel('gpt2')
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord)
+        lm.clean_predicted_words(sp.indexed_tokens[0])
+        yield lm, sp, WORD_LIST
+
+    def test_word_ids_match_decoded_alignment(self, setup_language_model):
+        lm, sp, word_list = setup_language_model
+        log_probability = lm.log_probability
+        words = lm.word
+        lm.collaspeSubWords(word_list, sp.word_ids)
+        expected = lm.log_probability.tolist()
+        lm.log_probability = log_probability
+        lm.word = words
+        lm.collaspeSubWords(word_list)
+        actual = lm.log_probability.tolist()
+        assert actual == pytest.approx(expected)
+
+    def test_collapsed_length_equals_words(self, setup_language_model):
+        lm, sp, word_list = setup_language_model
+        lm.collaspeSubWords(word_list, sp.word_ids)
+        actual = len(lm.log_probability)
+        expected = len(word_list)
+        assert actual == expected
+
+    def test_sums_sub_word_log_probabilities(self):
+        lm = languageModel('gpt2')
+        lm.word = ['th', 'is', 'is', 'a', 'te', 'st']
+        lm.log_probability = np.array([0.0, -1.0, -2.0, -3.0, -4.0, -5.0])
+        lm.collaspeSubWords(['this', 'is', 'a', 'test'])
+        actual = lm.log_probability.tolist()
+        expected = [-1.0, -2.0, -3.0, -9.0]
+        assert actual == expected
+
+    def test_mismatched_words_error(self):
+        lm = languageModel('gpt2')
+        lm.word = ['th', 'is']
+        lm.log_probability = np.array([0.0, -1.0])
+        with pytest.raises(ValueError):
+            lm.collaspeSubWords(['that'])
+
+
+
+
+class TestComputeSurprisal():
+
+    @pytest.fixture
+    def setup_language_model(self, setup_processor):
+        sp = setup_processor
+        lm = languageModel('gpt2')
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord)
+        lm.clean_predicted_words(sp.indexed_tokens[0])
+        lm.collaspeSubWords(WORD_LIST)
+        lm.computeSurprisal()
+
+        yield lm
+
+    def test_surprisal_is_array(self, setup_language_model):
+        actual = type(setup_language_model.surprisal)
+        expected = np.ndarray
         assert actual == expected
 
+    def test_surprisal_matches_probability(self, setup_language_model):
+        lm = setup_language_model
+        expected = [-math.log(p, 2) for p in lm.probability]
+        assert lm.surprisal.tolist() == pytest.approx(expected, rel=1e-6)
 
+    def test_no_surprisal_is_infinite(self, setup_language_model):
+        actual = np.isfinite(setup_language_model.surprisal).all()
+        expected = True
+        assert actual == expected
 
+    def test_log_probability_of_multi_piece_word_does_not_underflow(self):
+        lm = languageModel('gpt2')
+        lm.word = ['a', 'b', 'c']
+        lm.log_probability = np.array([-400.0, -400.0, -400.0])
+        lm.probability = np.exp(lm.log_probability).tolist()
+        lm.collaspeSubWords(['abc'])
+        lm.computeSurprisal()
+        actual = lm.surprisal[0]
+        expected = 1200 / math.log(2)
+        assert actual == pytest.approx(expected)
+
+class TestIncrementalWordProbability():
+
+    @pytest.fixture
+    def context_length(self):
+        return None
+
+    def test_matches_sequences_within_context(self, setup_processor):
+        sp = setup_processor
+        sp.text_to_sequences(100)
+        lm = languageModel('gpt2')
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord)
+        expected = lm.log_probability.tolist()
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, incremental=True)
+        actual = lm.log_probability.tolist()
+        assert actual == pytest.approx(expected, abs=1e-4)
+
+    def test_length_with_trimmed_cache(self, setup_processor):
+        sp = setup_processor
+        sp.text_to_sequences(4)
+        lm = languageModel('gpt2')
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, incremental=True)
+        actual = len(lm.probability)
+        expected = len(sp.indexed_nextWord)
+        assert actual == expected
+
+    def test_cannot_combine_with_batching(self, setup_processor):
+        sp = setup_processor
+        sp.text_to_sequences(4)
+        lm = languageModel('gpt2')
+        with pytest.raises(ValueError):
+            lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, max_tokens=32, incremental=True)
+
+class TestRecurrentWordProbability():
+
+    @pytest.fixture
+    def model_type(self):
+        return 'txl'
+
+    @pytest.mark.skip(reason='Due to length of runtime')
+    def test_length_of_streamed_probability(self, setup_processor):
+        sp = setup_processor
+        lm = languageModel('txl')
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, segment_length=8)
+        actual = len(lm.probability)
+        expected = len(sp.indexed_nextWord)
+        assert actual == expected
+
+    @pytest.mark.skip(reason='Due to length of runtime')
+    def test_segment_covering_text_matches_full_context(self, setup_processor):
+        sp = setup_processor
+        sp.text_to_sequences(100)
+        lm = languageModel('txl')
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord)
+        expected = lm.log_probability.tolist()
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, segment_length=100)
+        actual = lm.log_probability.tolist()
+        assert actual == pytest.approx(expected, abs=1e-4)
+
+    def test_only_for_transformer_xl(self):
+        word_list = ['this', 'is', 'an', 'example']
+        sp = sequence_processor('gpt2', ' '.join(word_list))
+        sp.tokenizeWords()
+        sp.text_to_sequences(4)
+        lm = languageModel('gpt2')
+        with pytest.raises(ValueError):
+            lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, segment_length=8)
 
+class TestContextSweep():
+
+    @pytest.fixture
+    def context_length(self):
+        return None
+
+    def test_shape_of_sweep(self, setup_processor):
+        sp = setup_processor
+        lm = languageModel('gpt2')
+        lm.context_sweep(sp.indexed_tokens, [2, 5, 10])
+        actual = lm.log_probability.shape
+        expected = (3, len(sp.indexed_tokens) - 1)
+        assert actual == expected
+
+    def test_each_context_matches_single_run(self, setup_processor):
+        sp = setup_processor
+        lm = languageModel('gpt2')
+        lm.context_sweep(sp.indexed_tokens, [2, 5, 10], max_tokens=64)
+        sweep = lm.log_probability
+        for row, context in enumerate([2, 5, 10]):
+            sp.text_to_sequences(context)
+            lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord)
+            assert sweep[row].tolist() == pytest.approx(lm.log_probability.tolist(), abs=1e-4)
+
+
+
+class TestWordProbabilityStatistics():
+
+    @pytest.fixture
+    def context_length(self):
+        return 5
+
+    def test_statistics_returned(self, setup_processor):
+        sp = setup_processor
+        lm = languageModel('gpt2')
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, statistics=['entropy', 'rank', 'top_k'])
+        actual = sorted(lm.statistics.keys())
+        expected = ['entropy', 'rank', 'top_k']
+        assert actual == expected
+        assert all(len(values) == len(sp.indexed_nextWord) for values in lm.statistics.values())
+
+    def test_statistics_ranges(self, setup_processor):
+        sp = setup_processor
+        lm = languageModel('gpt2')
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, statistics=['entropy', 'rank', 'top_k'])
+        assert np.all(lm.statistics['entropy'] >= 0)
+        assert np.all(lm.statistics['rank'] >= 1)
+        assert np.all((lm.statistics['top_k'] > 0) & (lm.statistics['top_k'] <= 1 + 1e-6))
+
+    def test_statistics_do_not_change_probability(self, setup_processor):
+        sp = setup_processor
+        lm = languageModel('gpt2')
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord)
+        expected = lm.log_probability.tolist()
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, statistics=['entropy', 'rank'], max_tokens=64)
+        actual = lm.log_probability.tolist()
+        assert actual == pytest.approx(expected, abs=1e-4)
+
+    def test_unknown_statistic(self, setup_processor):
+        sp = setup_processor
+        lm = languageModel('gpt2')
+        with pytest.raises(ValueError):
+            lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, statistics=['variance'])
+
+
+class TestQuantizedLanguageModel():
+
+    @pytest.fixture
+    def context_length(self):
+        return 5
+
+    def test_conv1d_to_linear_keeps_output(self):
+        model = GPT2LMHeadModel.from_pretrained('gpt2')
+        model.eval()
+        input_ids = torch.tensor([[1, 2, 3, 4]])
+        expected = model(input_ids)[0]
+        _conv1d_to_linear(model)
+        actual = model(input_ids)[0]
+        assert torch.allclose(actual, expected, atol=1e-5)
+
+    def test_quantized_probability_close_to_fp32(self, setup_processor):
+        sp = setup_processor
+        lm = languageModel('gpt2')
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord)
+        expected = lm.log_probability
+        quantized_lm = languageModel('gpt2', quantize=True)
+        quantized_lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord)
+        actual = quantized_lm.log_probability
+        assert actual.shape == expected.shape
+        assert np.corrcoef(actual, expected)[0, 1] > 0.9
+
+    def test_quantization_report(self):
+        report = quantization_report('gpt2', context=10)
+        assert report['mean_deviation'] >= 0
+        assert report['max_deviation'] >= report['mean_deviation']
+        assert report['int8_bytes'] < report['fp32_bytes']
+
+    @pytest.mark.skip(reason='Due to length of runtime')
+    def test_quantization_report_ctrl(self):
+        report = quantization_report('ctrl', context=10)
+        assert report['int8_bytes'] < report['fp32_bytes']
+
+
+class TestParallelWordProbability():
+
+    @pytest.fixture
+    def context_length(self):
+        return 5
+
+    def test_workers_match_serial(self, setup_processor):
+        sp = setup_processor
+        lm = languageModel('gpt2')
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, max_tokens=32)
+        expected = lm.log_probability.tolist()
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, max_tokens=32, workers=2)
+        actual = lm.log_probability.tolist()
+        assert actual == expected
+
+    def test_workers_with_incremental(self, setup_processor):
+        sp = setup_processor
+        lm = languageModel('gpt2')
+        with pytest.raises(ValueError):
+            lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, incremental=True, workers=2)
+
+
+class TestTorchscriptBackend():
+
+    @pytest.fixture
+    def context_length(self):
+        return 5
+
+    @pytest.fixture(autouse=True)
+    def release_traces(self):
+        registry.release(('trace', 'gpt2', False))
+        yield
+        registry.release(('trace', 'gpt2', False))
+
+    def test_matches_eager(self, setup_processor):
+        sp = setup_processor
+        lm = languageModel('gpt2')
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, max_tokens=32)
+        expected = lm.log_probability.tolist()
+        traced_lm = languageModel('gpt2', backend='torchscript')
+        for _ in range(2):
+            traced_lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, max_tokens=32)
+            actual = traced_lm.log_probability.tolist()
+            assert actual == pytest.approx(expected, abs=1e-4)
+
+    def test_graph_saved_to_directory(self, setup_processor, tmpdir):
+        sp = setup_processor
+        lm = languageModel('gpt2', backend='torchscript', trace_directory=str(tmpdir))
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord)
+        actual = len([file for file in os.listdir(str(tmpdir)) if file.endswith('.pt')])
+        expected = 1
+        assert actual == expected
+
+    def test_falls_back_to_eager(self, setup_processor, monkeypatch):
+        sp = setup_processor
+        lm = languageModel('gpt2')
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord)
+        expected = lm.log_probability.tolist()
+
+        def fail(*args, **kwargs):
+            raise RuntimeError('cannot trace')
+
+        monkeypatch.setattr(torch.jit, 'trace', fail)
+        traced_lm = languageModel('gpt2', backend='torchscript')
+        with pytest.warns(UserWarning):
+            traced_lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord)
+        actual = traced_lm.log_probability.tolist()
+        assert actual == pytest.approx(expected, abs=1e-6)
+
+    def test_replaced_graph_is_checked_again(self, setup_processor):
+        sp = setup_processor
+        lm = languageModel('gpt2', backend='torchscript')
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, max_tokens=32)
+        traces = registry.get(('trace', 'gpt2', False), dict)
+        graph_key = ('cpu', True)
+        assert any(key[:2] == graph_key for key in traces['checked'])
+        lm._replace_graph(traces, graph_key, traces['graphs'][graph_key])
+        assert not any(key[:2] == graph_key for key in traces['checked'])
+
+    def test_loaded_graph_counts_toward_memory(self, setup_processor, tmpdir):
+        sp = setup_processor
+        lm = languageModel('gpt2', backend='torchscript', trace_directory=str(tmpdir))
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord)
+        # a freshly traced graph shares the weights of the model
+        traced_memory = registry.memory_usage()
+        registry.release(('trace', 'gpt2', False))
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord)
+        actual = registry.memory_usage() - traced_memory
+        expected = memory_footprint(lm.model)
+        assert actual == expected
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            languageModel('gpt2', backend='onnx')
+
+    def test_benchmark_backends(self, tmpdir):
+        report = benchmark_backends('gpt2', repeats=1, trace_directory=str(tmpdir))
+        assert report['eager_seconds'] > 0
+        assert report['torchscript_seconds'] > 0
+        assert report['max_deviation'] < 1e-3
+
+
+class TestTokenStoreWordSurprisal():
+
+    def test_warm_store_skips_tokenizer(self, tmpdir, monkeypatch):
+        words = ['this', 'is', 'an', 'example', 'string', 'to', 'use', 'for', 'testing', 'purposes']
+        monkeypatch.setenv('TOKEN_STORE_DIR', str(tmpdir))
+        # the decode table is only written to the store when it is built
+        registry.release_matching(lambda key: key[0] in ('tokenizer', 'decode_table'))
+        expected = word_surprisal('gpt2', words, 5)['Surprisal'].tolist()
+
+        registry.release_matching(lambda key: key[0] in ('tokenizer', 'decode_table'))
+
+        def fail(modelType):
+            raise AssertionError('The tokenizer was loaded')
+
+        monkeypatch.setattr(sequence_processor, '_loadTokenizer', staticmethod(fail))
+        actual = word_surprisal('gpt2', words, 5)['Surprisal'].tolist()
+        assert actual == expected
+        registry.release_matching(lambda key: key[0] in ('tokenizer', 'decode_table'))
+
+
+class TestStreamWordSurprisal():
+
+    @pytest.fixture
+    def setup_words(self):
+        yield WORD_LIST * 3
+
+    def test_matches_word_surprisal(self, setup_words):
+        words = setup_words
+        expected = word_surprisal('gpt2', words, 8)['Surprisal'].tolist()
+        actual = [surprisal for _, surprisal in stream_word_surprisal('gpt2', iter(words), 8, chunk_words=7)]
+        assert actual == pytest.approx(expected, abs=1e-6)
+
+    def test_batched_matches_word_surprisal(self, setup_words):
+        words = setup_words
+        expected = word_surprisal('gpt2', words, 8)['Surprisal'].tolist()
+        actual = [surprisal for _, surprisal in stream_word_surprisal('gpt2', iter(words), 8, chunk_words=7,
+                                                                      max_tokens=64)]
+        assert actual == pytest.approx(expected, abs=1e-4)
+
+    @pytest.mark.parametrize('options', [{'stride': 1}, {'incremental': True}, {'segment_length': 8}])
+    def test_whole_stream_options_error(self, setup_words, options):
+        words = setup_words
+        with pytest.raises(ValueError):
+            stream_word_surprisal('gpt2', iter(words), 8, chunk_words=7, **options)
+
+    def test_yields_each_word(self, setup_words):
+        words = setup_words
+        actual = [word for word, _ in stream_word_surprisal('gpt2', words, 8, chunk_words=7)]
+        expected = words
+        assert actual == expected
+
+    def test_reads_file(self, setup_words, tmpdir):
+        words = setup_words
+        path = tmpdir.join('text.txt')
+        path.write('This is, an Example!\n' + ' '.join(words[4:]))
+        actual = [word for word, _ in stream_word_surprisal('gpt2', str(path), 8, chunk_words=7)]
+        expected = words
+        assert actual == expected
+
+
+class TestCheckpointedWordProbability():
+
+    @pytest.fixture
+    def context_length(self):
+        return 5
+
+    def test_matches_uncheckpointed(self, setup_processor, tmpdir):
+        sp = setup_processor
+        lm = languageModel('gpt2')
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, max_tokens=32)
+        expected = lm.log_probability.tolist()
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, max_tokens=32,
+                            checkpoint=str(tmpdir.join('checkpoint')))
+        actual = lm.log_probability.tolist()
+        assert actual == expected
+
+    def test_resume_is_bit_identical(self, setup_processor, tmpdir):
+        sp = setup_processor
+        checkpoint = str(tmpdir.join('checkpoint'))
+        lm = languageModel('gpt2')
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, checkpoint=checkpoint, statistics=['rank'])
+        expected = lm.log_probability.tolist()
+        size = os.path.getsize(checkpoint)
+
+        # an interruption part way through a record
+        with open(checkpoint, 'r+b') as f:
+            f.truncate(size // 2 + 3)
+
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, checkpoint=checkpoint, statistics=['rank'])
+        actual = lm.log_probability.tolist()
+        assert actual == expected
+        assert os.path.getsize(checkpoint) == size
+
+    def test_finished_batches_are_not_rescored(self, setup_processor, tmpdir, monkeypatch):
+        sp = setup_processor
+        checkpoint = str(tmpdir.join('checkpoint'))
+        lm = languageModel('gpt2')
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, checkpoint=checkpoint)
+        expected = lm.log_probability.tolist()
+
+        def fail(*args, **kwargs):
+            raise AssertionError('a finished batch was scored again')
+
+        monkeypatch.setattr(lm, '_score_batch', fail)
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, checkpoint=checkpoint)
+        actual = lm.log_probability.tolist()
+        assert actual == expected
+
+    def test_other_job_rejected(self, setup_processor, tmpdir):
+        sp = setup_processor
+        checkpoint = str(tmpdir.join('checkpoint'))
+        lm = languageModel('gpt2')
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, checkpoint=checkpoint)
+        with pytest.raises(ValueError):
+            lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, max_tokens=32, checkpoint=checkpoint)
+
+    def test_windows_hashed_without_lists(self, setup_processor, tmpdir, monkeypatch):
+        sp = setup_processor
+        lm = languageModel('gpt2')
+
+        def fail(self):
+            raise AssertionError('the windows were converted to lists')
+
+        monkeypatch.setattr(contextWindows, 'tolist', fail)
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, checkpoint=str(tmpdir.join('checkpoint')))
+
+    def test_other_targets_rejected(self, setup_processor, tmpdir):
+        sp = setup_processor
+        checkpoint = str(tmpdir.join('checkpoint'))
+        lm = languageModel('gpt2')
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, checkpoint=checkpoint)
+        with pytest.raises(ValueError):
+            lm.word_probability(sp.indexed_sequences, list(reversed(sp.indexed_nextWord)), checkpoint=checkpoint)
+
+    def test_synced_once_per_interval(self, setup_processor, tmpdir, monkeypatch):
+        sp = setup_processor
+        syncs = []
+        monkeypatch.setattr(language_modelling, 'CHECKPOINT_SYNC_SECONDS', 3600)
+        monkeypatch.setattr(os, 'fsync', syncs.append)
+        lm = languageModel('gpt2')
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, checkpoint=str(tmpdir.join('checkpoint')))
+        assert len(syncs) == 1
@@ -0,0 +1,135 @@
+import os
+
+import pytest
+import torch
+from transformers import GPT2LMHeadModel, CTRLLMHeadModel, TransfoXLLMHeadModel
+from src.features.layer_streaming import layerStreamedModel, export_layers
+from src.features.language_modelling import languageModel
+from src.data.sequence_preprocessing import sequence_processor
+
+
+class TestExportLayers():
+
+    def test_manifest_written(self, tmpdir):
+        model = GPT2LMHeadModel.from_pretrained('gpt2')
+        export_layers(model, 'gpt2', str(tmpdir))
+        assert os.path.exists(os.path.join(str(tmpdir), 'manifest.json'))
+        assert os.path.exists(os.path.join(str(tmpdir), 'h.0.attn.c_attn.weight.npy'))
+
+    def test_unsupported_model(self, tmpdir):
+        model = TransfoXLLMHeadModel.from_pretrained('transfo-xl-wt103')
+        with pytest.raises(ValueError):
+            export_layers(model, 'txl', str(tmpdir))
+
+
+class TestLayerStreamedModel():
+
+    @pytest.fixture
+    def setup_model(self, tmpdir):
+        model = GPT2LMHeadModel.from_pretrained('gpt2')
+        model.eval()
+        export_layers(model, 'gpt2', str(tmpdir))
+        yield model, layerStreamedModel(str(tmpdir), vocab_chunk=100)
+
+    def test_logits_match_model(self, setup_model):
+        model, streamed_model = setup_model
+        input_ids = torch.tensor([[1, 2, 3, 4, 5], [6, 7, 8, 9, 10]])
+        expected = model(input_ids)[0]
+        actual = streamed_model(input_ids)[0]
+        assert torch.allclose(actual, expected, atol=1e-5)
+
+    def test_masked_logits_match_model(self, setup_model):
+        model, streamed_model = setup_model
+        input_ids = torch.tensor([[1, 2, 3, 4, 5], [6, 7, 8, 0, 0]])
+        attention_mask = torch.tensor([[1, 1, 1, 1, 1], [1, 1, 1, 0, 0]])
+        expected = model(input_ids, attention_mask=attention_mask)[0]
+        actual = streamed_model(input_ids, attention_mask)[0]
+        assert torch.allclose(actual, expected, atol=1e-5)
+
+    def test_logits_at_positions_match_model(self, setup_model):
+        model, streamed_model = setup_model
+        input_ids = torch.tensor([[1, 2, 3, 4, 5], [6, 7, 8, 0, 0]])
+        attention_mask = torch.tensor([[1, 1, 1, 1, 1], [1, 1, 1, 0, 0]])
+        expected = model(input_ids, attention_mask=attention_mask)[0]
+        actual = streamed_model(input_ids, attention_mask, [[4], [0, 2]])[0]
+        assert [tuple(logits.shape) for logits in actual] == [(1, expected.shape[2]), (2, expected.shape[2])]
+        assert torch.allclose(actual[0], expected[0, [4]], atol=1e-5)
+        assert torch.allclose(actual[1], expected[1, [0, 2]], atol=1e-5)
+
+    def test_holds_one_block(self, setup_model):
+        model, streamed_model = setup_model
+        actual = sum(parameter.numel() for parameter in streamed_model.parameters())
+        expected = sum(parameter.numel() for parameter in model.transformer.h[0].parameters())
+        assert actual == expected
+
+    @pytest.mark.skip(reason='Due to length of runtime')
+    def test_ctrl_logits_match_model(self, tmpdir):
+        model = CTRLLMHeadModel.from_pretrained('ctrl')
+        model.eval()
+        export_layers(model, 'ctrl', str(tmpdir))
+        streamed_model = layerStreamedModel(str(tmpdir))
+        input_ids = torch.tensor([[1, 2, 3, 4, 5]])
+        assert torch.allclose(streamed_model(input_ids)[0], model(input_ids)[0], atol=1e-4)
+
+
+class TestLayerStreamedWordProbability():
+
+    def test_matches_eager(self, tmpdir):
+        word_list = ['this', 'is', 'an', 'example', 'string', 'to',
+                     'use', 'for', 'testing', 'purposes']
+        sp = sequence_processor('gpt2', ' '.join(word_list))
+        sp.tokenizeWords()
+        sp.text_to_sequences(4)
+
+        lm = languageModel('gpt2')
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, max_tokens=32)
+        expected = lm.log_probability.tolist()
+
+        export_layers(lm.model, 'gpt2', str(tmpdir))
+        streamed_lm = languageModel('gpt2', backend='layer_streamed', layer_directory=str(tmpdir))
+        streamed_lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, max_tokens=32)
+        actual = streamed_lm.log_probability.tolist()
+        assert actual == pytest.approx(expected, abs=1e-4)
+
+    def test_default_token_budget(self, tmpdir):
+        word_list = ['this', 'is', 'an', 'example', 'string', 'to',
+                     'use', 'for', 'testing', 'purposes']
+        sp = sequence_processor('gpt2', ' '.join(word_list))
+        sp.tokenizeWords()
+        sp.text_to_sequences(4)
+
+        lm = languageModel('gpt2')
+        lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord)
+        expected = lm.log_probability.tolist()
+
+        export_layers(lm.model, 'gpt2', str(tmpdir))
+        streamed_lm = languageModel('gpt2', backend='layer_streamed', layer_directory=str(tmpdir))
+        calls = []
+        forward = streamed_lm.model.forward
+        streamed_lm.model.forward = lambda *args: calls.append(args) or forward(*args)
+        streamed_lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord)
+        assert len(calls) == 1
+        assert streamed_lm.log_probability.tolist() == pytest.approx(expected, abs=1e-4)
+
+    def test_projects_read_positions_only(self, tmpdir, monkeypatch):
+        word_list = ['this', 'is', 'an', 'example', 'string', 'to',
+                     'use', 'for', 'testing', 'purposes']
+        sp = sequence_processor('gpt2', ' '.join(word_list))
+        sp.tokenizeWords()
+        sp.text_to_sequences(4)
+
+        lm = languageModel('gpt2')
+        export_layers(lm.model, 'gpt2', str(tmpdir))
+        streamed_lm = languageModel('gpt2', backend='layer_streamed', layer_directory=str(tmpdir))
+        rows = []
+        logits = streamed_lm.model._logits
+        monkeypatch.setattr(streamed_lm.model, '_logits',
+                            lambda hidden_states, *args: rows.append(hidden_states.shape[0]) or
+                            logits(hidden_states, *args))
+        streamed_lm.word_probability(sp.indexed_sequences, sp.indexed_nextWord, stride=2)
+        assert sum(rows) == len(sp.indexed_nextWord)
+
+    def test_missing_directory(self, monkeypatch):
+        monkeypatch.delenv('LM_LAYER_DIR', raising=False)
+        with pytest.raises(ValueError):
+            languageModel('gpt2', backend='layer_streamed')
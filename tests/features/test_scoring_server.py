@@ -0,0 +1,137 @@
+import threading
+
+import pytest
+from src.features.language_modelling import word_surprisal, batch_word_surprisal
+from src.features.scoring_server import scoringServer, microBatcher, remote_word_surprisal
+from src.features.surprisal_cache import cached_word_surprisal
+
+
+class TestBatchWordSurprisal():
+
+    def test_matches_single_texts(self):
+        word_lists = [['this', 'is', 'a', 'test'], ['it', 'will', 'be', 'used', 'for', 'testing']]
+        covariates = batch_word_surprisal('gpt2', word_lists, 5, max_tokens=64)
+        for words, text_covariates in zip(word_lists, covariates):
+            expected = word_surprisal('gpt2', words, 5)['Surprisal'].tolist()
+            actual = text_covariates['Surprisal'].tolist()
+            assert actual == pytest.approx(expected, abs=1e-4)
+
+    def test_fast_tokenizer(self):
+        word_lists = [['this', 'is', 'a', 'test'], ['it', 'will', 'be', 'used', 'for', 'testing']]
+        expected = [covariates['Surprisal'].tolist() for covariates in batch_word_surprisal('gpt2', word_lists, 5)]
+        covariates = batch_word_surprisal('gpt2', word_lists, 5, tokenizer_backend='fast')
+        actual = [text_covariates['Surprisal'].tolist() for text_covariates in covariates]
+        assert actual == expected
+
+    def test_stride_rejected(self):
+        with pytest.raises(ValueError):
+            batch_word_surprisal('gpt2', [['this', 'is', 'a', 'test']], 5, stride=2)
+
+
+class TestMicroBatcher():
+
+    def test_concurrent_requests_share_a_batch(self):
+        batcher = microBatcher(max_delay=0.5)
+        word_lists = [['this', 'is', 'a', 'test'], ['it', 'will', 'be', 'used'], ['for', 'testing', 'purposes']]
+        futures = [batcher.submit('gpt2', words, 5) for words in word_lists]
+        batcher.start()
+        results = [future.result(timeout=60) for future in futures]
+        batcher.stop()
+        assert [len(result) for result in results] == [4, 4, 3]
+        assert batcher.batches == 1
+        assert batcher.requests == 3
+
+    def test_error_is_returned_to_caller(self):
+        batcher = microBatcher(max_delay=0)
+        batcher.start()
+        future = batcher.submit('unknown', ['this', 'is', 'a', 'test'], 5)
+        with pytest.raises(NameError):
+            future.result(timeout=60)
+        batcher.stop()
+
+    def test_malformed_request_fails_alone(self):
+        batcher = microBatcher(max_delay=0)
+        batcher.start()
+        bad_context = batcher.submit('gpt2', ['this', 'is', 'a', 'test'], [5, 10])
+        bad_options = batcher.submit('gpt2', ['this', 'is', 'a', 'test'], 5, {'statistics': {'rank'}})
+        with pytest.raises(ValueError):
+            bad_context.result(timeout=60)
+        with pytest.raises(TypeError):
+            bad_options.result(timeout=60)
+        actual = len(batcher.submit('gpt2', ['this', 'is', 'a', 'test'], 5).result(timeout=60))
+        batcher.stop()
+        expected = 4
+        assert actual == expected
+
+    def test_thread_survives_scoring_error(self, monkeypatch):
+        batcher = microBatcher(max_delay=0)
+        batcher.start()
+
+        def fail(batch):
+            raise RuntimeError('scoring failed')
+
+        monkeypatch.setattr(batcher, '_score', fail)
+        with pytest.raises(RuntimeError):
+            batcher.submit('gpt2', ['this', 'is', 'a', 'test'], 5).result(timeout=60)
+        monkeypatch.undo()
+        actual = len(batcher.submit('gpt2', ['this', 'is', 'a', 'test'], 5).result(timeout=60))
+        batcher.stop()
+        expected = 4
+        assert actual == expected
+
+
+class TestScoringServer():
+
+    @pytest.fixture
+    def setup_server(self):
+        server = scoringServer(port=0, max_delay=0.05)
+        address = server.start()
+        yield address
+        server.shutdown()
+
+    def test_remote_matches_local(self, setup_server):
+        words = ['this', 'is', 'a', 'test', 'of', 'the', 'language', 'models']
+        expected = word_surprisal('gpt2', words, 5)['Surprisal'].tolist()
+        actual = remote_word_surprisal(setup_server, 'gpt2', words, 5)['Surprisal'].tolist()
+        assert actual == pytest.approx(expected, abs=1e-4)
+
+    def test_concurrent_clients(self, setup_server):
+        word_lists = [['this', 'is', 'a', 'test'], ['it', 'will', 'be', 'used', 'for', 'testing']] * 3
+        results = [None] * len(word_lists)
+
+        def score(i):
+            results[i] = remote_word_surprisal(setup_server, 'gpt2', word_lists[i], 5)
+
+        threads = [threading.Thread(target=score, args=(i,)) for i in range(len(word_lists))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert [len(result) for result in results] == [len(words) for words in word_lists]
+
+    def test_bad_request(self, setup_server):
+        with pytest.raises(ValueError):
+            remote_word_surprisal(setup_server, 'unknown', ['this', 'is', 'a', 'test'], 5)
+
+    def test_unhashable_context(self, setup_server):
+        with pytest.raises(ValueError):
+            remote_word_surprisal(setup_server, 'gpt2', ['this', 'is', 'a', 'test'], [5, 10], timeout=60)
+        actual = len(remote_word_surprisal(setup_server, 'gpt2', ['this', 'is', 'a', 'test'], 5, timeout=60))
+        expected = 4
+        assert actual == expected
+
+    def test_unix_socket(self, tmpdir):
+        server = scoringServer(socket_path=str(tmpdir.join('surprisal.sock')))
+        address = server.start()
+        actual = len(remote_word_surprisal(address, 'gpt2', ['this', 'is', 'a', 'test'], 5))
+        server.shutdown()
+        expected = 4
+        assert actual == expected
+
+    def test_interfaces_use_server(self, setup_server, monkeypatch):
+        monkeypatch.delenv('SURPRISAL_CACHE_DIR', raising=False)
+        monkeypatch.setenv('SURPRISAL_SERVER', setup_server)
+        words = ['this', 'is', 'a', 'test']
+        actual = cached_word_surprisal('gpt2', words, 5)['Surprisal'].tolist()
+        expected = word_surprisal('gpt2', words, 5)['Surprisal'].tolist()
+        assert actual == pytest.approx(expected, abs=1e-4)
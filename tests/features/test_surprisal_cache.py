@@ -0,0 +1,125 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import src.features.surprisal_cache as sc
+from src.features.surprisal_cache import surprisalCache, cached_word_surprisal, joint_word_surprisal
+
+
+class TestCacheKey():
+
+    @pytest.fixture
+    def setup_cache(self, tmpdir):
+        yield surprisalCache(str(tmpdir))
+
+    def test_same_input_same_key(self, setup_cache):
+        actual = setup_cache.key('gpt2', 5, ['this', 'is', 'a', 'test'])
+        expected = setup_cache.key('gpt2', 5, ['this', 'is', 'a', 'test'])
+        assert actual == expected
+
+    def test_key_changes_with_context(self, setup_cache):
+        actual = setup_cache.key('gpt2', 5, ['this', 'is', 'a', 'test'])
+        expected = setup_cache.key('gpt2', 10, ['this', 'is', 'a', 'test'])
+        assert actual != expected
+
+    def test_key_changes_with_model(self, setup_cache):
+        actual = setup_cache.key('gpt2', 5, ['this', 'is', 'a', 'test'])
+        expected = setup_cache.key('txl', 5, ['this', 'is', 'a', 'test'])
+        assert actual != expected
+
+    def test_key_changes_with_scoring_options(self, setup_cache):
+        actual = setup_cache.key('gpt2', 5, ['this', 'is', 'a', 'test'])
+        expected = setup_cache.key('gpt2', 5, ['this', 'is', 'a', 'test'], {'stride': 2})
+        assert actual != expected
+
+    def test_key_ignores_execution_options(self, setup_cache):
+        actual = setup_cache.key('gpt2', 5, ['this', 'is', 'a', 'test'],
+                                 {'stride': 2, 'workers': 4, 'threads_per_worker': 2, 'checkpoint': 'job'})
+        expected = setup_cache.key('gpt2', 5, ['this', 'is', 'a', 'test'], {'stride': 2})
+        assert actual == expected
+
+
+class TestCacheStorage():
+
+    def test_stored_values_are_loaded(self, tmpdir):
+        cache = surprisalCache(str(tmpdir))
+        cache.store('entry', pd.DataFrame(data={'Surprisal': [0.0, 1.5, 2.5]}))
+        actual = cache.load('entry')['Surprisal'].tolist()
+        expected = [0.0, 1.5, 2.5]
+        assert actual == expected
+
+    def test_stored_columns_are_loaded(self, tmpdir):
+        cache = surprisalCache(str(tmpdir))
+        cache.store('entry', pd.DataFrame(data={'Surprisal': [0.0, 1.5], 'Rank': [1.0, 3.0]}))
+        actual = cache.load('entry').columns.tolist()
+        expected = ['Surprisal', 'Rank']
+        assert actual == expected
+
+    def test_other_writers_temporary_file_untouched(self, tmpdir):
+        cache = surprisalCache(str(tmpdir))
+        tmpdir.join('entry.npy.tmp').write('other')
+        cache.store('entry', pd.DataFrame(data={'Surprisal': [0.0, 1.5, 2.5]}))
+        assert tmpdir.join('entry.npy.tmp').read() == 'other'
+        assert [file for file in os.listdir(str(tmpdir)) if file != 'entry.npy.tmp'] == ['entry.npy']
+
+    def test_missing_entry_is_none(self, tmpdir):
+        cache = surprisalCache(str(tmpdir))
+        actual = cache.load('missing')
+        assert actual is None
+
+    def test_eviction_keeps_within_size(self, tmpdir):
+        cache = surprisalCache(str(tmpdir))
+        cache.store('first', pd.DataFrame(data={'Surprisal': np.zeros(100)}))
+        cache.max_bytes = cache.size() + 10
+        cache.store('second', pd.DataFrame(data={'Surprisal': np.zeros(100)}))
+        actual = [entry[0] for entry in cache.entries()]
+        expected = ['second']
+        assert actual == expected
+
+    def test_clear_removes_entries(self, tmpdir):
+        cache = surprisalCache(str(tmpdir))
+        cache.store('entry', pd.DataFrame(data={'Surprisal': np.zeros(10)}))
+        cache.clear()
+        actual = len(cache.entries())
+        expected = 0
+        assert actual == expected
+
+
+class TestCachedWordSurprisal():
+
+    def test_hit_skips_language_model(self, tmpdir, monkeypatch):
+        cache = surprisalCache(str(tmpdir))
+        words = ['this', 'is', 'a', 'test']
+        expected = cached_word_surprisal('gpt2', words, 5, cache)['Surprisal'].tolist()
+
+        def fail(*args, **kwargs):
+            raise AssertionError('the language model should not run on a cache hit')
+
+        monkeypatch.setattr(sc, 'word_surprisal', fail)
+        actual = cached_word_surprisal('gpt2', words, 5, cache)['Surprisal'].tolist()
+        assert actual == expected
+
+    def test_no_cache_computes_surprisal(self, monkeypatch):
+        monkeypatch.delenv('SURPRISAL_CACHE_DIR', raising=False)
+        actual = len(cached_word_surprisal('gpt2', ['this', 'is', 'a', 'test'], 5))
+        expected = 4
+        assert actual == expected
+
+
+class TestJointWordSurprisal():
+
+    def test_columns_for_each_model(self, tmpdir):
+        cache = surprisalCache(str(tmpdir))
+        covariates = joint_word_surprisal(['gpt2', 'ctrl'], ['this', 'is', 'a', 'test'], 5, cache)
+        actual = list(covariates.columns)
+        expected = ['Surprisal_gpt2', 'Surprisal_ctrl']
+        assert actual == expected
+        assert len(covariates) == 4
+
+    def test_matches_single_model(self, tmpdir):
+        cache = surprisalCache(str(tmpdir))
+        words = ['this', 'is', 'a', 'test']
+        expected = cached_word_surprisal('gpt2', words, 5, cache)['Surprisal'].tolist()
+        actual = joint_word_surprisal(['gpt2'], words, 5, cache)['Surprisal_gpt2'].tolist()
+        assert actual == expected
@@ -1,5 +1,7 @@
+import asyncio
 import pytest
 import src.interfaces.eeg_interface as eei
+from src.features.async_scoring import asyncScorer
 from random_words import RandomWords
 import pandas as pd
 import numpy as np
@@ -44,6 +46,45 @@ class TestCalculateCovariates:
         assert actual == expected
 
 
+    def test_context_sweep_columns(self, set_up_data):
+        randomwords = set_up_data
+        surprisal = eei.calculate_covariates('gpt2', randomwords, [2, 5])
+        actual = list(surprisal.columns)
+        expected = ['Surprisal_2', 'Surprisal_5']
+        assert actual == expected
+        assert len(surprisal) == len(set_up_data)
+
+    def test_statistics_columns(self, set_up_data):
+        randomwords = set_up_data
+        covariates = eei.calculate_covariates('gpt2', randomwords, 5, statistics=['entropy', 'rank', 'top_k'])
+        actual = list(covariates.columns)
+        expected = ['Surprisal', 'Entropy', 'Rank', 'Top_k']
+        assert actual == expected
+
+    def test_multi_model_columns(self, set_up_data):
+        randomwords = set_up_data
+        covariates = eei.calculate_covariates(['gpt2', 'ctrl'], randomwords, 5)
+        actual = list(covariates.columns)
+        expected = ['Surprisal_gpt2', 'Surprisal_ctrl']
+        assert actual == expected
+        assert len(covariates) == len(set_up_data)
+
+
+class TestCalculateCovariatesAsync:
+
+    def test_length_surprisal_gpt2(self):
+        randomwords = RandomWords().random_words(count=50)
+
+        async def calculate():
+            async with asyncScorer() as scorer:
+                return await eei.calculate_covariates_async(scorer, 'gpt2', randomwords, 5)
+
+        covariates = asyncio.run(calculate())
+        actual = len(covariates)
+        expected = len(randomwords)
+        assert actual == expected
+
+
 class TestPreprocessedEEG:
 
     @pytest.fixture
@@ -0,0 +1,127 @@
+import pytest
+import torch
+from src.utilities.model_registry import modelRegistry, memory_footprint, registry
+from src.features.language_modelling import languageModel, release_model
+
+
+class TestMemoryFootprint():
+
+    def test_size_of_module(self):
+        module = torch.nn.Linear(10, 10)
+        actual = memory_footprint(module)
+        expected = (10 * 10 + 10) * 4
+        assert actual == expected
+
+    def test_size_of_tuple_counts_modules_only(self):
+        module = torch.nn.Linear(10, 10)
+        actual = memory_footprint(('tokenizer', module))
+        expected = (10 * 10 + 10) * 4
+        assert actual == expected
+
+    def test_tied_weights_counted_once(self):
+        module = torch.nn.Sequential(torch.nn.Linear(10, 10), torch.nn.Linear(10, 10))
+        module[1].weight = module[0].weight
+        actual = memory_footprint(module)
+        expected = (10 * 10 + 10 + 10) * 4
+        assert actual == expected
+
+    def test_dict_counts_shared_tensors_once(self):
+        module = torch.nn.Linear(10, 10)
+        actual = memory_footprint({'a': module, 'b': module})
+        expected = (10 * 10 + 10) * 4
+        assert actual == expected
+
+    def test_exclude(self):
+        module = torch.nn.Linear(10, 10)
+        other = torch.nn.Linear(10, 10)
+        actual = memory_footprint([module, other], exclude=module)
+        expected = (10 * 10 + 10) * 4
+        assert actual == expected
+
+    def test_quantized_module_is_smaller(self):
+        module = torch.nn.Sequential(torch.nn.Linear(100, 100))
+        quantized = torch.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+        assert 0 < memory_footprint(quantized) < memory_footprint(module)
+
+
+class TestModelRegistry():
+
+    def test_loads_once(self):
+        models = modelRegistry()
+        first = models.get('a', lambda: torch.nn.Linear(2, 2))
+        second = models.get('a', lambda: torch.nn.Linear(2, 2))
+        assert first is second
+        assert models.loads == 1
+        assert models.hits == 1
+
+    def test_evicts_least_recently_used(self):
+        size = memory_footprint(torch.nn.Linear(10, 10))
+        models = modelRegistry(memory_budget=2 * size)
+        models.get('a', lambda: torch.nn.Linear(10, 10))
+        models.get('b', lambda: torch.nn.Linear(10, 10))
+        models.get('a', lambda: torch.nn.Linear(10, 10))
+        models.get('c', lambda: torch.nn.Linear(10, 10))
+        actual = models.stats()['keys']
+        expected = ['a', 'c']
+        assert actual == expected
+        assert models.evictions == 1
+
+    def test_resize_evicts(self):
+        size = memory_footprint(torch.nn.Linear(10, 10))
+        models = modelRegistry(memory_budget=2 * size)
+        models.get('a', lambda: torch.nn.Linear(10, 10))
+        models.get('traces', dict)
+        models.resize('traces', 2 * size)
+        actual = models.stats()['keys']
+        expected = ['traces']
+        assert actual == expected
+
+    def test_keeps_model_larger_than_budget(self):
+        models = modelRegistry(memory_budget=1)
+        models.get('a', lambda: torch.nn.Linear(10, 10))
+        actual = models.stats()['keys']
+        expected = ['a']
+        assert actual == expected
+
+    def test_lowering_budget_evicts(self):
+        models = modelRegistry()
+        models.get('a', lambda: torch.nn.Linear(10, 10))
+        models.get('b', lambda: torch.nn.Linear(10, 10))
+        models.set_memory_budget(memory_footprint(torch.nn.Linear(10, 10)))
+        actual = models.stats()['keys']
+        expected = ['b']
+        assert actual == expected
+
+    def test_release_matching(self):
+        models = modelRegistry()
+        models.get(('model', 'gpt2'), lambda: torch.nn.Linear(2, 2))
+        models.get(('model', 'txl'), lambda: torch.nn.Linear(2, 2))
+        models.get(('tokenizer', 'gpt2'), lambda: 'tokenizer')
+        models.release_matching(lambda key: key[0] == 'model' and key[1] == 'gpt2')
+        actual = models.stats()['keys']
+        expected = [('model', 'txl'), ('tokenizer', 'gpt2')]
+        assert actual == expected
+
+    def test_failed_load_is_not_stored(self):
+        models = modelRegistry()
+
+        def loader():
+            raise NameError
+
+        with pytest.raises(NameError):
+            models.get('a', loader)
+        assert models.stats()['keys'] == []
+
+
+class TestSharedLanguageModel():
+
+    def test_language_models_share_weights(self):
+        first = languageModel('gpt2')
+        second = languageModel('gpt2')
+        assert first.model is second.model
+        assert ('model', 'gpt2') in registry.stats()['keys']
+
+    def test_release_model(self):
+        languageModel('gpt2')
+        release_model('gpt2')
+        assert ('model', 'gpt2') not in registry.stats()['keys']